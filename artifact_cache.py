@@ -0,0 +1,200 @@
+#
+# artifact_cache.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Content-addressed cache for build outputs. idf.py build and mkspiffs
+#          only run when the sources, spiffs_image/, partition table or mkspiffs
+#          parameters change; every other unit flashes the cached images.
+# v1.0.1 - Key also covers the SHA-256 of every build output, the IDF version and
+#          dependencies.lock; with no source inputs the outputs alone are the key
+#
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+CACHE_DIR = ".artifact_cache"
+MANIFEST = "manifest.json"
+
+# Everything that feeds idf.py build / mkspiffs, relative to the IDF project root.
+SOURCE_INPUTS = [
+    "CMakeLists.txt",
+    "main",
+    "components",
+    "sdkconfig",
+    "sdkconfig.defaults",
+    "partitions.csv",
+    "dependencies.lock",
+    "spiffs_image",
+]
+
+# Build output locations, relative to the IDF project root.
+DEFAULT_ARTIFACTS = {
+    "bootloader": "build/bootloader/bootloader.bin",
+    "partition_table": "build/partition_table/partition-table.bin",
+    "ota_data": "build/ota_data_initial.bin",
+    "app": "build/PianoGuard_DCM-1.bin",
+    "spiffs": "spiffs.bin",
+}
+
+SKIP_DIRS = {".git", "build", "__pycache__", CACHE_DIR}
+
+
+def idf_version():
+    """ESP-IDF version of the active environment ("" outside one)."""
+    version = os.environ.get("ESP_IDF_VERSION", "")
+    idf_path = os.environ.get("IDF_PATH")
+    if idf_path:
+        try:
+            with open(os.path.join(idf_path, "version.txt")) as f:
+                version += f.read().strip()
+        except OSError:
+            version += idf_path
+    return version
+
+
+class ArtifactCache:
+    def __init__(self, root=CACHE_DIR, project_dir=".", inputs=SOURCE_INPUTS, artifacts=DEFAULT_ARTIFACTS, log=print):
+        self.root = root
+        self.project_dir = project_dir
+        self.inputs = inputs
+        self.artifacts = artifacts
+        self.log = log
+        self._lock = threading.Lock()
+        self._file_digests = {}
+        self._warned = False
+
+    def _input_files(self):
+        for name in self.inputs:
+            path = os.path.join(self.project_dir, name)
+            if os.path.isfile(path):
+                yield name, path
+            elif os.path.isdir(path):
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS)
+                    for filename in sorted(filenames):
+                        full = os.path.join(dirpath, filename)
+                        yield os.path.relpath(full, self.project_dir), full
+
+    def _file_digest(self, path):
+        # Re-hash a file only when its size or mtime moves; a long-running
+        # station checks the inputs once per unit.
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._file_digests.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        self._file_digests[path] = (stamp, digest)
+        return digest
+
+    def input_hash(self, params=""):
+        """SHA-256 over every input file (path + content), the build params, the artifact
+        layout and the IDF version. None when no input file exists at all.
+        """
+        sha = hashlib.sha256()
+        sha.update(params.encode("utf-8"))
+        sha.update(json.dumps(self.artifacts, sort_keys=True).encode("utf-8"))
+        sha.update(idf_version().encode("utf-8"))
+        found = False
+        for rel, path in self._input_files():
+            found = True
+            sha.update(rel.replace(os.sep, "/").encode("utf-8"))
+            sha.update(self._file_digest(path).encode("ascii"))
+        return sha.hexdigest() if found else None
+
+    def output_digests(self):
+        """{artifact name: SHA-256} of the build outputs on disk now (missing ones left out)."""
+        digests = {}
+        for name, rel in self.artifacts.items():
+            path = os.path.join(self.project_dir, rel)
+            if os.path.isfile(path):
+                digests[name] = self._file_digest(path)
+        return digests
+
+    def cache_key(self, source_hash, outputs):
+        """Entry key: the source hash (if any) plus the content of every build output."""
+        if not outputs:
+            return None
+        sha = hashlib.sha256()
+        sha.update((source_hash or "").encode("ascii"))
+        sha.update(json.dumps(outputs, sort_keys=True).encode("ascii"))
+        return sha.hexdigest()
+
+    def lookup(self, key):
+        manifest_path = os.path.join(self.root, key, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        entry_dir = os.path.join(self.root, key)
+        return {name: os.path.join(entry_dir, filename) for name, filename in manifest["artifacts"].items()}
+
+    def store(self, key, source_hash=None, outputs=None):
+        os.makedirs(self.root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=self.root)
+        stored = {}
+        for name, rel in self.artifacts.items():
+            src = os.path.join(self.project_dir, rel)
+            if not os.path.exists(src):
+                continue
+            filename = f"{name}.bin"
+            shutil.copy2(src, os.path.join(staging, filename))
+            stored[name] = filename
+        if not stored:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise RuntimeError("Build produced none of the expected artifacts.")
+        with open(os.path.join(staging, MANIFEST), "w") as f:
+            json.dump({"key": key, "input_hash": source_hash, "artifact_sha256": outputs, "artifacts": stored},
+                      f, indent=2)
+        entry_dir = os.path.join(self.root, key)
+        try:
+            os.rename(staging, entry_dir)
+        except OSError:
+            # Another process stored the same key first; its copy is identical.
+            shutil.rmtree(staging, ignore_errors=True)
+        return self.lookup(key)
+
+    def ensure(self, build, params="", log=None):
+        """Return {artifact name: cached path}, running `build()` only on a cache miss.
+
+        An entry is only reused when both the source inputs and the build
+        outputs on disk still match it. Without any source inputs the outputs
+        are taken as they are and never rebuilt: a replaced build/firmware.bin
+        simply gets a new entry.
+        """
+        log = log or self.log
+        with self._lock:
+            source_hash = self.input_hash(params)
+            if source_hash is None and not self._warned:
+                log("WARNING: No build source inputs found; caching the build outputs by content only.")
+                self._warned = True
+            outputs = self.output_digests()
+            key = self.cache_key(source_hash, outputs)
+            cached = key and self.lookup(key)
+            if cached:
+                log(f"INFO: Using cached build artifacts {key[:12]}")
+                return cached
+            if source_hash is not None or not outputs:
+                log(f"INFO: No cached artifacts for {(source_hash or 'these outputs')[:12]}, building...")
+                build()
+                outputs = self.output_digests()
+                key = self.cache_key(source_hash, outputs)
+                if key is None:
+                    raise RuntimeError("Build produced none of the expected artifacts.")
+            cached = self.lookup(key)
+            if not cached:
+                log(f"INFO: Caching build artifacts {key[:12]}")
+                cached = self.store(key, source_hash, outputs)
+            return cached
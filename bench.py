@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+#
+# bench.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Provisioning throughput benchmark: drives the station on simulated
+#          boards (sim_device) against a local stand-in for the registration
+#          backend, sweeping fixture count, firmware size and backend latency.
+#          Reports units/hour, p50/p95/p99 per stage and CPU/RSS, and saves
+#          each run as JSON for comparison between releases.
+# v1.0.1 - Backend request latency (RegistrationClient stats) saved per point
+#
+# Every sweep point runs in its own process and scratch directory, so its CPU,
+# peak RSS, production DB and counter are its own.
+#
+# Usage:
+#   ./bench.py                                   # 1/4/8/16/32 fixtures, shipped firmware
+#   ./bench.py --fixtures 4 16 --sizes firmware 2M --latency 0 0.25
+#   ./bench.py --sim "kbit_s=900,link_error_rate=0.02" --compare bench_results/v1.5.json
+#
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE = os.path.join(HERE, "firmware", "firmware.bin")
+RESULTS_DIR = os.path.join(HERE, "bench_results")
+DEFAULT_FIXTURES = (1, 4, 8, 16, 32)
+UNITS_PER_FIXTURE = 3
+# Stages reported in the summary table; every span name ends up in the JSON.
+STAGES = ("fixture_stage", "background_stage", "connect", "flash", "verify", "register", "label", "http_post")
+BOOTLOADER_SIZE = 20 * 1024
+PARTITION_TABLE_SIZE = 3 * 1024
+POINT_TIMEOUT = 1800
+
+
+class BackendStandIn:
+    """Local /api/factory/provision (and /batch) that accepts everything after `latency` seconds."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                with backend._lock:
+                    backend.requests += 1
+                time.sleep(backend.latency)
+                if self.path == "/api/factory/provision/batch":
+                    body = {"results": [{"idempotency_key": d.get("idempotency_key"), "status": "created"}
+                                        for d in payload.get("devices", [])]}
+                elif self.path == "/api/factory/provision":
+                    body = {"status": "created"}
+                else:
+                    self.send_error(404)
+                    return
+                data = json.dumps(body).encode()
+                self.send_response(201)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="bench-backend", daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_size(text):
+    """"firmware" (the shipped image) or a byte count such as 694K, 2M, 1.5M."""
+    if text == "firmware":
+        return os.path.getsize(FIRMWARE)
+    units = {"K": 1024, "M": 1024 * 1024}
+    if text[-1].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Nearest-rank percentiles of `values` as {"p50": ..., ...}."""
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {f"p{p}": round(ordered[max(0, -(-len(ordered) * p // 100) - 1)], 4) for p in points}
+
+
+def stage_artifacts(app_size):
+    """Lay out build/ in the current (scratch) directory with an app of `app_size` bytes.
+
+    Larger apps repeat the shipped firmware so they compress like real ones.
+    """
+    with open(FIRMWARE, "rb") as f:
+        firmware = f.read()
+    app = (firmware * (app_size // len(firmware) + 1))[:app_size]
+    files = {"build/bootloader/bootloader.bin": firmware[:BOOTLOADER_SIZE],
+             "build/partition_table/partition-table.bin": firmware[-PARTITION_TABLE_SIZE:],
+             "build/firmware.bin": app}
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def run_point(point):
+    """Run one sweep point in this process. Returns its result dict."""
+    import resource
+
+    stage_artifacts(point["size"])
+    # provisioning reads PIANOGUARD_* (set by the parent) at import.
+    import provisioning
+    from metrics import tracer
+    from outbox import PENDING, REGISTERED
+    from station import ProvisioningStation
+
+    provisioning.artifact_cache.ensure(lambda: None, log=lambda message: None)
+    ports = [f"sim{i}" for i in range(point["fixtures"])]
+    remaining = dict.fromkeys(ports, point["units"])
+    station = ProvisioningStation(ports)
+    started = time.monotonic()
+    # Put the next board on each fixture as soon as its last one comes off.
+    while any(remaining.values()):
+        idle = [port for port in ports if remaining[port] and not station.is_busy(port)]
+        for port in station.start(idle) if idle else []:
+            remaining[port] -= 1
+        while not station.events.empty():
+            station.events.get_nowait()
+        time.sleep(0.01)
+    station.wait()
+    station.shutdown()
+    elapsed = time.monotonic() - started
+
+    outbox = provisioning.get_registration_outbox()
+    deadline = time.monotonic() + 60
+    while outbox.counts()[PENDING] and time.monotonic() < deadline:
+        outbox.flush_once()
+    outbox.stop()
+    tracer.flush()
+
+    durations = {}
+    with open(tracer.spans_path) as f:
+        for line in f:
+            span = json.loads(line)
+            if span["outcome"] in ("ok", "flashed", "passed"):
+                durations.setdefault(span["name"], []).append(span["duration_s"])
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss_bytes = usage.ru_maxrss * (1 if platform.system() == "Darwin" else 1024)
+    results = station.results.results()
+    passed = [r for r in results if r["status"] == provisioning.PASSED]
+    rates = [r["flash_kbit_s"] for r in passed if r.get("flash_kbit_s")]
+    return dict(point,
+                passed=len(passed),
+                failed=len(results) - len(passed),
+                elapsed_s=round(elapsed, 3),
+                units_per_hour=round(len(passed) * 3600 / elapsed, 1) if elapsed else 0.0,
+                registered=outbox.counts()[REGISTERED],
+                backend=provisioning.registration_client.stats.summary(),
+                cpu_s=round(usage.ru_utime + usage.ru_stime, 3),
+                max_rss_mb=round(rss_bytes / 1024 / 1024, 1),
+                flash_kbit_s=round(sum(rates) / len(rates), 1) if rates else None,
+                stages={name: dict(count=len(values), **percentiles(values))
+                        for name, values in sorted(durations.items())})
+
+
+def run_sweep(args, log=print):
+    sizes = [(text, parse_size(text)) for text in args.sizes]
+    points = [{"fixtures": fixtures, "size_name": name, "size": size, "latency": latency, "units": args.units}
+              for latency in args.latency for name, size in sizes for fixtures in args.fixtures]
+    backend = BackendStandIn().start()
+    results = []
+    try:
+        for number, point in enumerate(points, 1):
+            log(f"[{number}/{len(points)}] {point['fixtures']} fixture(s), {point['size_name']} "
+                f"({point['size'] // 1024} KB), backend latency {point['latency'] * 1000:.0f} ms...")
+            backend.latency = point["latency"]
+            result = run_point_process(point, backend.url, args)
+            if result:
+                results.append(result)
+                log(f"    {format_row(result)}")
+    finally:
+        backend.stop()
+    return results
+
+
+def run_point_process(point, backend_url, args):
+    scratch = tempfile.mkdtemp(prefix="pianoguard-bench-")
+    output = os.path.join(scratch, "result.json")
+    env = dict(os.environ,
+               PIANOGUARD_DEVICE="sim",
+               PIANOGUARD_SIM=args.sim,
+               PIANOGUARD_API_URL=backend_url,
+               PIANOGUARD_LOT="bench",
+               PIANOGUARD_LABEL_BACKEND=args.labels,
+               PIANOGUARD_LABEL_PRINTER=os.path.join(scratch, "zpl"))
+    with open(os.path.join(scratch, "bench.log"), "w") as log_file:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), "--point", json.dumps(point),
+                                  "--output", output],
+                                 cwd=scratch, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+                                 timeout=POINT_TIMEOUT)
+    if process.returncode != 0 or not os.path.exists(output):
+        print(f"ERROR: Sweep point failed (exit {process.returncode}); see {scratch}/bench.log", file=sys.stderr)
+        return None
+    with open(output) as f:
+        result = json.load(f)
+    shutil.rmtree(scratch, ignore_errors=True)
+    return result
+
+
+def format_row(result):
+    fixture = result["stages"].get("fixture_stage", {})
+    return (f"{result['passed']}/{result['passed'] + result['failed']} passed, "
+            f"{result['units_per_hour']:.0f} units/h, fixture p50/p95/p99 "
+            f"{fixture.get('p50', 0):.2f}/{fixture.get('p95', 0):.2f}/{fixture.get('p99', 0):.2f} s, "
+            f"CPU {result['cpu_s']:.1f} s, RSS {result['max_rss_mb']:.0f} MB")
+
+
+def print_report(results, baseline=None, out=sys.stdout):
+    header = f"{'fix':>4} {'app KB':>7} {'lat ms':>6} {'pass':>5} {'units/h':>8} {'cpu s':>6} {'rss MB':>6}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header, file=out)
+    previous = {_key(r): r for r in baseline or []}
+    for r in results:
+        row = (f"{r['fixtures']:>4} {r['size'] // 1024:>7} {r['latency'] * 1000:>6.0f} {r['passed']:>5} "
+               f"{r['units_per_hour']:>8.0f} {r['cpu_s']:>6.1f} {r['max_rss_mb']:>6.0f}")
+        old = previous.get(_key(r))
+        if old and old["units_per_hour"]:
+            row += f" {(r['units_per_hour'] / old['units_per_hour'] - 1) * 100:>+7.1f}%"
+        print(row, file=out)
+        for name in STAGES:
+            stats = r["stages"].get(name)
+            if stats:
+                print(f"       {name:<17} p50 {stats['p50']:>7.3f}  p95 {stats['p95']:>7.3f}  "
+                      f"p99 {stats['p99']:>7.3f} s  (n={stats['count']})", file=out)
+
+
+def _key(result):
+    return result["fixtures"], result["size"], result["latency"]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, args, path=None):
+    revision = git_revision()
+    path = path or os.path.join(RESULTS_DIR, f"bench_{time.strftime('%Y%m%d_%H%M%S')}_{revision or 'local'}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_revision": revision,
+                   "python": platform.python_version(), "platform": platform.platform(),
+                   "cpus": os.cpu_count(), "sim": args.sim, "labels": args.labels, "points": results},
+                  f, indent=2)
+    return path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PianoGuard provisioning throughput benchmark (simulated boards).")
+    parser.add_argument("--fixtures", type=int, nargs="+", default=list(DEFAULT_FIXTURES))
+    parser.add_argument("--sizes", nargs="+", default=["firmware"],
+                        help="app image sizes: 'firmware' (the shipped image) or e.g. 694K, 2M")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0],
+                        help="backend response latency(s) in seconds")
+    parser.add_argument("--units", type=int, default=UNITS_PER_FIXTURE, help="boards per fixture")
+    parser.add_argument("--sim", default="", help="sim_device settings, e.g. 'kbit_s=900,connect_latency=0.3'")
+    parser.add_argument("--labels", choices=("png", "zpl"), default="png")
+    parser.add_argument("--save", metavar="PATH", help="results file (default: bench_results/bench_<time>_<rev>.json)")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--compare", metavar="PATH", help="earlier results file to compare against")
+    parser.add_argument("--point", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.point:
+        result = run_point(json.loads(args.point))
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["points"]
+    results = run_sweep(args)
+    if not results:
+        return 1
+    print()
+    print_report(results, baseline)
+    if not args.no_save:
+        print(f"\nSaved {save(results, args, args.save)}")
+    complete = len(results) == len(args.fixtures) * len(args.sizes) * len(args.latency)
+    return 0 if complete and all(r["failed"] == 0 for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+#
+# device_session.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.1.8
+#
+# v1.0.0 - In-process esptool driver. One port open, one sync and one stub
+#          upload per unit; flash, MAC read and verify all reuse that connection
+#          instead of spawning esptool.py / espefuse.py for every step.
+# v1.1.0 - Adaptive baud: probe from 2 Mbaud down, fall back on sync/checksum
+#          errors (also mid-flash) and remember the winning rate per fixture.
+# v1.1.1 - Factory MAC captured during chip sync; read_mac() no longer talks to the chip
+# v1.1.2 - Writes report live progress events through on_progress
+# v1.1.3 - flash_md5() for per-region verify; write_flash(verify=False) leaves the check to the caller
+# v1.1.4 - Writes send the shared pre-compressed blocks from image_store
+# v1.1.5 - The first session per fixture in each run probes from the top again,
+#          so one bad cable or noisy run does not cap the fixture for good
+# v1.1.6 - Only timeouts, bad packets and checksum/MD5 mismatches count as link
+#          errors, and a session falls back at most MAX_FALLBACKS times mid-write
+# v1.1.7 - baud_rates.json keeps 0644 across rewrites (mkstemp files are 0600)
+# v1.1.8 - verify() removed: flash_md5() covers it
+#
+
+import json
+import os
+import tempfile
+import threading
+
+from esptool.cmds import detect_chip
+from esptool.util import FatalError
+from serial import SerialTimeoutException
+from serial.tools import list_ports
+
+import diff_flash
+from flash_progress import FlashProgress
+from image_store import image_store
+from mac_reader import read_factory_mac
+
+ROM_BAUD = 115200
+# Highest first. USB-serial bridges that cannot hold a rate fail the probe and
+# the next one down is tried.
+BAUD_CANDIDATES = (2000000, 1500000, 921600, 460800, 230400, ROM_BAUD)
+BAUD_PROBE_SIZE = 0x1000
+STATE_DIR = ".factory_state"
+BAUD_CACHE_FILE = os.path.join(STATE_DIR, "baud_rates.json")
+
+# esptool errors that mean "this link is not stable at this rate" rather than
+# a bad unit: timeouts, garbled packets, checksum / MD5 mismatches.
+LINK_ERROR_MESSAGES = (
+    "No serial data received", "Serial data stream stopped", "Packet content transfer stopped",
+    "Timed out", "Invalid head of packet", "Invalid SLIP escape", "Digest mismatch", "Corrupt data",
+    "Bad data checksum", "CRC or checksum was invalid", "Failed to set baud rate",
+)
+# Lower-rate retries of a write per session; a unit that keeps failing is bad, not the link.
+MAX_FALLBACKS = 2
+
+
+def is_link_error(error):
+    if isinstance(error, SerialTimeoutException):
+        return True
+    return isinstance(error, FatalError) and any(message in str(error) for message in LINK_ERROR_MESSAGES)
+
+
+class BaudError(RuntimeError):
+    """The chip synced at the ROM rate but the link failed at a higher one."""
+
+
+def fixture_key(port):
+    """Stable name for the physical fixture behind `port`.
+
+    The USB location (hub path) survives re-enumeration and identifies the
+    cable/hub port rather than the board plugged into it; fall back to the
+    resolved device path when pyserial has no location.
+    """
+    device = os.path.realpath(port)
+    for info in list_ports.comports():
+        if os.path.realpath(info.device) == device and info.location:
+            return f"usb:{info.location}"
+    return device
+
+
+class BaudCache:
+    """Best known baud per fixture, persisted as JSON and shared by every session.
+
+    The remembered rate is trusted from the second session of a run on; the
+    first one for each fixture (see first_use) probes the full range again.
+    """
+
+    def __init__(self, path=BAUD_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._rates = None
+        self._used = set()
+
+    def _load(self):
+        if self._rates is None:
+            try:
+                with open(self.path) as f:
+                    self._rates = json.load(f)
+            except (OSError, ValueError):
+                self._rates = {}
+        return self._rates
+
+    def get(self, key):
+        with self._lock:
+            return self._load().get(key)
+
+    def first_use(self, key):
+        """True the first time it is asked about `key` in this process."""
+        with self._lock:
+            if key in self._used:
+                return False
+            self._used.add(key)
+            return True
+
+    def put(self, key, baud):
+        with self._lock:
+            rates = self._load()
+            if rates.get(key) == baud:
+                return
+            rates[key] = baud
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd, tmp = tempfile.mkstemp(prefix=".baud-", dir=os.path.dirname(self.path) or ".")
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w") as f:
+                json.dump(rates, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+baud_cache = BaudCache()
+
+
+class DeviceSession:
+    """Stub-loaded esptool connection to one ESP32-S3.
+
+        with DeviceSession(port) as session:
+            session.write_flash(image, 0x0)
+            mac = session.read_mac()
+
+    With `baud=None` the session negotiates the rate: it starts from the rate
+    remembered for this fixture (or the top of BAUD_CANDIDATES) and steps down
+    until a read-back probe passes. The first session on each fixture in a run
+    always starts from the top, so a rate lost to a bad cable comes back.
+
+    `on_progress`, if given, receives flash_progress events while writing.
+    """
+
+    def __init__(self, port, baud=None, log=print, cache=baud_cache, on_progress=None):
+        self.port = port
+        self.requested_baud = baud
+        self.baud = None
+        self.log = log
+        self.cache = cache
+        self.on_progress = on_progress
+        self.esp = None
+        self.mac = None
+        self._fixture = None
+        self._fallbacks = 0
+
+    def _candidates(self):
+        if self.requested_baud:
+            return [self.requested_baud]
+        first = self.cache.first_use(self._fixture)
+        remembered = self.cache.get(self._fixture)
+        if remembered and not first:
+            return [b for b in BAUD_CANDIDATES if b <= remembered] or [ROM_BAUD]
+        return list(BAUD_CANDIDATES)
+
+    def _connect(self, baud):
+        # A failed sync at the ROM rate is a missing or dead board, not a
+        # baud problem, so it is raised as-is.
+        esp = detect_chip(self.port, ROM_BAUD)
+        try:
+            self.mac = read_factory_mac(esp)
+            esp = esp.run_stub()
+            esp.flash_spi_attach(0)
+        except Exception:
+            esp._port.close()
+            raise
+        try:
+            if baud != ROM_BAUD:
+                esp.change_baud(baud)
+                # read_flash checks an MD5 of the data it streams back, so a
+                # marginal link shows up here instead of halfway through a write.
+                esp.read_flash(0, BAUD_PROBE_SIZE)
+        except (FatalError, OSError) as e:
+            esp._port.close()
+            if not is_link_error(e):
+                raise
+            raise BaudError(e)
+        self.esp = esp
+        self.baud = baud
+
+    def open(self):
+        self._fixture = fixture_key(self.port)
+        self.log(f"INFO: Connecting to {self.port}...")
+        self._open_from(self._candidates())
+        return self
+
+    def _open_from(self, candidates):
+        last_error = None
+        for baud in candidates:
+            try:
+                self._connect(baud)
+            except BaudError as e:
+                last_error = e
+                self.log(f"WARNING: {self.port} not stable at {baud} baud ({e}), falling back...")
+                continue
+            self.log(f"INFO: Connected at {baud} baud.")
+            return
+        raise RuntimeError(f"Could not connect to {self.port}: {last_error}")
+
+    def _fall_back(self, error):
+        """Drop to the next lower rate after a link error.
+
+        Re-raises `error` if it is not a link error, there is no lower rate,
+        or this session has already fallen back MAX_FALLBACKS times.
+        """
+        lower = [b for b in BAUD_CANDIDATES if b < self.baud] if not self.requested_baud else []
+        if not is_link_error(error) or not lower or self._fallbacks >= MAX_FALLBACKS:
+            raise error
+        self._fallbacks += 1
+        self.log(f"WARNING: Link error at {self.baud} baud ({error}), retrying slower...")
+        self.close(reset=False)
+        self._open_from(lower)
+
+    def close(self, reset=True):
+        if self.esp is None:
+            return
+        try:
+            if reset:
+                self.esp.hard_reset()
+        finally:
+            self.esp._port.close()
+            self.esp = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.baud and not self.requested_baud:
+            self.cache.put(self._fixture, self.baud)
+        self.close()
+
+    def read_mac(self):
+        """Factory MAC in canonical form, as read while syncing."""
+        return self.mac
+
+    def write_flash(self, image_path, offset, verify=True):
+        """Compressed write of the whole image, then (unless `verify` is False) an MD5 check.
+
+        Returns bytes written.
+        """
+        image = image_store.get(image_path)
+        size = len(image.padded(4))
+        while True:
+            # Restarted after a fall-back so the rate reflects the link in use.
+            progress = FlashProgress(size, self.on_progress, address=offset) if self.on_progress else None
+            try:
+                # Blocks are split to the stub's write size, which is the same on every port.
+                blocks = image.blocks(self.esp.FLASH_WRITE_SIZE)
+                diff_flash.write_blocks(self.esp, offset, size, blocks, progress and progress.advance)
+                diff_flash.finish_flash(self.esp)
+                break
+            except (FatalError, OSError) as e:
+                self._fall_back(e)
+        if verify and self.esp.flash_md5sum(offset, size) != image.md5(4):
+            raise RuntimeError("MD5 of image does not match data in flash!")
+        return size
+
+    def diff_flash(self, image_path, offset):
+        while True:
+            try:
+                return diff_flash.diff_flash(self.esp, image_path, offset, log=self.log,
+                                             on_progress=self.on_progress)
+            except (FatalError, OSError) as e:
+                self._fall_back(e)
+
+    def flash_md5(self, offset, size):
+        """MD5 (hex) of `size` bytes of flash at `offset`, computed on the chip."""
+        while True:
+            try:
+                return self.esp.flash_md5sum(offset, size)
+            except (FatalError, OSError) as e:
+                self._fall_back(e)
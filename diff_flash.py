@@ -0,0 +1,111 @@
+#
+# diff_flash.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.3
+#
+# v1.0.0 - Differential flashing for reworked / returned units: compare on-device
+#          MD5s with the cached image and only erase+write the sectors that differ.
+# v1.0.1 - Connection handling moved to device_session.DeviceSession
+# v1.0.2 - Per-block progress callback for live flash progress
+# v1.0.3 - write_blocks() sends pre-compressed blocks; images come from image_store
+#
+
+import hashlib
+import zlib
+
+from esptool.loader import DEFAULT_TIMEOUT, ERASE_WRITE_TIMEOUT_PER_MB, ESPLoader, timeout_per_mb
+
+from flash_progress import FlashProgress
+from image_store import image_store
+
+SECTOR_SIZE = 0x1000
+# First pass checksums 64 KB ranges; only mismatching ranges are split into sectors.
+CHUNK_SIZE = 0x10000
+
+
+def _matches(esp, image, offset, start, size):
+    return esp.flash_md5sum(offset + start, size) == hashlib.md5(image[start:start + size]).hexdigest()
+
+
+def changed_ranges(esp, image, offset, chunk_size=CHUNK_SIZE):
+    """Return [(start, size)] of sector-aligned ranges of `image` that differ on the device."""
+    ranges = []
+    for chunk in range(0, len(image), chunk_size):
+        chunk_len = min(chunk_size, len(image) - chunk)
+        if _matches(esp, image, offset, chunk, chunk_len):
+            continue
+        for sector in range(chunk, chunk + chunk_len, SECTOR_SIZE):
+            if _matches(esp, image, offset, sector, SECTOR_SIZE):
+                continue
+            if ranges and ranges[-1][0] + ranges[-1][1] == sector:
+                ranges[-1] = (ranges[-1][0], ranges[-1][1] + SECTOR_SIZE)
+            else:
+                ranges.append((sector, SECTOR_SIZE))
+    return ranges
+
+
+def compress_blocks(data, block_size):
+    """[(compressed block, uncompressed bytes it carries)] for `data`, as write_blocks() sends them."""
+    compressed = zlib.compress(data, 9)
+    decompress = zlib.decompressobj()
+    return [(block, len(decompress.decompress(block)))
+            for block in (compressed[i:i + block_size] for i in range(0, len(compressed), block_size))]
+
+
+def write_blocks(esp, address, size, blocks, progress=None):
+    """Write `size` bytes at `address` from already deflated `blocks` (see compress_blocks).
+
+    The stub erases the sectors as it goes. `progress(nbytes)` is called
+    with the uncompressed size of each block sent.
+    """
+    esp.flash_defl_begin(size, sum(len(block) for block, _ in blocks), address)
+    timeout = DEFAULT_TIMEOUT
+    for seq, (block, block_size) in enumerate(blocks):
+        # The stub ACKs a block on receipt and writes it while the next one
+        # arrives, so each block waits for the previous block's write time.
+        block_timeout = max(DEFAULT_TIMEOUT, timeout_per_mb(ERASE_WRITE_TIMEOUT_PER_MB, block_size))
+        esp.flash_defl_block(block, seq, timeout=timeout)
+        timeout = block_timeout
+        if progress:
+            progress(block_size)
+    # Not ACKed until the last block is actually in flash.
+    esp.read_reg(ESPLoader.CHIP_DETECT_MAGIC_REG_ADDR, timeout=timeout)
+
+
+def write_region(esp, address, data, progress=None):
+    """Compressed write of `data` at `address`."""
+    write_blocks(esp, address, len(data), compress_blocks(data, esp.FLASH_WRITE_SIZE), progress)
+
+
+def finish_flash(esp):
+    """Leave flash mode without rebooting, same as esptool's write_flash."""
+    esp.flash_begin(0, 0)
+    esp.flash_defl_finish(False)
+
+
+def diff_flash(esp, image_path, offset, log=print, on_progress=None):
+    """Bring the flash at `offset` in line with `image_path`, touching only changed sectors.
+
+    `on_progress` gets FlashProgress events over the bytes actually written.
+    Returns {"bytes_written", "bytes_skipped", "ranges"}.
+    """
+    image = image_store.get(image_path).padded(SECTOR_SIZE)
+
+    ranges = changed_ranges(esp, image, offset)
+    written = sum(size for _, size in ranges)
+    progress = FlashProgress(written, on_progress, address=offset) if on_progress and written else None
+    for start, size in ranges:
+        if progress:
+            progress.address = offset + start
+        write_region(esp, offset + start, image[start:start + size], progress and progress.advance)
+    if ranges:
+        finish_flash(esp)
+        for start, size in ranges:
+            if not _matches(esp, image, offset, start, size):
+                raise RuntimeError(f"Verify failed at {offset + start:#x} after diff flash.")
+
+    log(f"INFO: Diff flash wrote {written} bytes in {len(ranges)} range(s), skipped {len(image) - written} bytes.")
+    return {"bytes_written": written, "bytes_skipped": len(image) - written, "ranges": ranges}
@@ -3,10 +3,18 @@
 # factory-tool-v1.1.py
 #
 # Created on: 2025-07-27
-# Edited on: 2025-07-27
+# Edited on: 2026-10-17
 #     Author: R. Andrew Ballard (c) 2025 "Andwardo"
-#     Version: v1.1.1
+#     Version: v1.1.8
 # Adds response confirmation and error reporting for factory registration
+# v1.1.2 - Flash from the artifact cache; build and mkspiffs only run on input changes
+# v1.1.3 - One compressed write_flash of the pre-merged image instead of two esptool runs
+# v1.1.4 - Read just the factory MAC instead of dumping the espefuse.py summary
+# v1.1.5 - Registration through RegistrationClient (keep-alive, retries on 5xx/timeouts)
+# v1.1.6 - Live flash progress (percent, kbit/s) while esptool runs
+# v1.1.7 - Flash and MAC read through one in-process DeviceSession instead of an IDF esptool.py subprocess
+# v1.1.8 - Flashes only the partition table, app and spiffs again (no bootloader or ota_data),
+#          one write per merged image so NVS and phy_init are left as they are
 #
 
 import os
@@ -15,42 +23,47 @@ import sys
 import json
 import requests
 
+from artifact_cache import ArtifactCache
+from flash_image import merged_images
+from flash_progress import format_progress
+from device_session import DeviceSession
+from registration import RegistrationClient
+
 DEFAULT_PORT = "/dev/cu.usbmodem101"
-API_URL = "https://dev1.pgapi.net/api/factory/provision"
+API_BASE = "https://dev1.pgapi.net"
+PROVISION_PATH = "/api/factory/provision"
 FACTORY_KEY = os.environ.get("PIANOGUARD_FACTORY_KEY")
+MKSPIFFS_CMD = "~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin"
+# Written by the esptool command this replaced; the bootloader and ota_data are not.
+ARTIFACTS = {"partition_table": "build/partition_table/partition-table.bin", "app": "build/PianoGuard_DCM-1.bin", "spiffs": "spiffs.bin"}
+# Used when the partition table does not name the partition.
+OFFSETS = {"partition_table": 0x8000, "spiffs": 0x12000, "app": 0xa0000}
 
 def run(cmd, check=True):
     print(f"Running: {cmd}")
     subprocess.run(cmd, shell=True, check=check)
 
+def show_progress(event):
+    print(f"Flashing {format_progress(event)}")
+
 def build_project():
     run("idf.py build")
 
 def create_spiffs():
-    run("~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin")
-
-def flash_spiffs(port):
-    run(f"esptool.py --port {port} write_flash 0x180000 spiffs.bin")
-
-def flash_all(port):
-    run(f"""~/.espressif/python_env/idf4.4_py3.9_env/bin/python ~/esp-idf-v4.4.4/components/esptool_py/esptool/esptool.py \
-  --chip esp32s3 --port {port} --baud 460800 \
-  write_flash --flash_mode dio --flash_size detect --flash_freq 80m \
-  0x8000   build/partition_table/partition-table.bin \
-  0xa0000  build/PianoGuard_DCM-1.bin \
-  0x12000  spiffs.bin""")
-
-def read_mac(port):
-    result = subprocess.run(f"espefuse.py -p {port} summary", shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    output = result.stdout
-    for line in output.splitlines():
-        if "Factory MAC Address" in line or "MAC (BLOCK1)" in line:
-            parts = line.split("=")
-            if len(parts) >= 2:
-                mac = parts[1].strip().split(" ")[0]
-                print(f"MAC Address: {mac}")
-                return mac
-    raise RuntimeError("MAC address not found")
+    run(MKSPIFFS_CMD)
+
+def build_artifacts():
+    return ArtifactCache(artifacts=ARTIFACTS).ensure(lambda: (build_project(), create_spiffs()), params=MKSPIFFS_CMD)
+
+def flash_all(session, artifacts):
+    for offset, image in merged_images(artifacts, OFFSETS):
+        print(f"Flashing {image} at {offset:#x}")
+        session.write_flash(image, offset)
+
+def read_mac(session):
+    mac = session.read_mac()
+    print(f"MAC Address: {mac}")
+    return mac
 
 def hash_mac(mac):
     import hashlib
@@ -61,16 +74,13 @@ def post_to_server(mac_hash):
         print("ERROR: PIANOGUARD_FACTORY_KEY not set in environment.")
         sys.exit(1)
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-factory-api-key": FACTORY_KEY
-    }
+    client = RegistrationClient(API_BASE, FACTORY_KEY)
     payload = {
         "mac_hash": mac_hash
     }
 
     try:
-        response = requests.post(API_URL, headers=headers, json=payload, timeout=10)
+        response = client.post(PROVISION_PATH, payload)
         response.raise_for_status()
         data = response.json()
         if data.get("status") == "ok":
@@ -85,11 +95,10 @@ def post_to_server(mac_hash):
 def main():
     port = os.environ.get("ESPPORT", DEFAULT_PORT)
     print(f"Using port: {port}")
-    build_project()
-    create_spiffs()
-    flash_spiffs(port)
-    flash_all(port)
-    mac = read_mac(port)
+    artifacts = build_artifacts()
+    with DeviceSession(port, on_progress=show_progress) as session:
+        flash_all(session, artifacts)
+        mac = read_mac(session)
     mac_hash = hash_mac(mac)
     post_to_server(mac_hash)
 
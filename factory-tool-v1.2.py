@@ -3,75 +3,72 @@
  * File: factory-tool-v1.2.py
  * Description: PianoGuard DCM-1 base firmware and cert flasher.
  * Created on: 2025-07-25
- * Edited on: 2025-07-27
- * Version: v1.2.0
+ * Edited on: 2026-10-17
+ * Version: v1.2.6
  * Author: R. Andrew Ballard (c) 2025 "Andwardo"
  * Fixes MAC extraction from espefuse.py summary output
+ * v1.2.1: flash from the artifact cache; build and mkspiffs only run on input changes
+ * v1.2.2: one compressed write_flash of the pre-merged image instead of two esptool runs
+ * v1.2.3: read just the factory MAC instead of regex-scanning the espefuse.py summary
+ * v1.2.4: live flash progress (percent, kbit/s) while esptool runs
+ * v1.2.5: flash and MAC read through one in-process DeviceSession instead of an IDF esptool.py subprocess
+ * v1.2.6: one write per merged image; NVS and phy_init between them are left as they are
 """
 
 import subprocess
 import os
-import re
 import sys
 
+from artifact_cache import ArtifactCache
+from flash_image import merged_images
+from flash_progress import format_progress
+from device_session import DeviceSession
+
 PORT = os.environ.get("ESPPORT", "/dev/cu.usbmodem101")
-IDF_ENV = "~/.espressif/python_env/idf4.4_py3.9_env/bin/python"
-ESPIDF = "~/esp-idf-v4.4.4/components/esptool_py/esptool/esptool.py"
 MK_SPIFFS = "~/mkspiffs/bin/mkspiffs"
 BUILD_DIR = "./build"
 SPIFFS_IMAGE_DIR = "./spiffs_image"
 SPIFFS_BIN = "./spiffs.bin"
 APP_BIN = os.path.join(BUILD_DIR, "PianoGuard_DCM-1.bin")
 PART_TABLE = os.path.join(BUILD_DIR, "partition_table/partition-table.bin")
+MKSPIFFS_CMD = f"{MK_SPIFFS} -c {SPIFFS_IMAGE_DIR} -b 4096 -p 256 -s 0x80000 {SPIFFS_BIN}"
+ARTIFACTS = {"partition_table": PART_TABLE, "app": APP_BIN, "spiffs": SPIFFS_BIN}
+# Used when the partition table does not name the partition.
+OFFSETS = {"partition_table": 0x8000, "spiffs": 0x12000, "app": 0xa0000}
 
 def run(cmd, check=True):
     print(f"Running: {cmd}")
     subprocess.run(cmd, shell=True, check=check)
 
+def show_progress(event):
+    print(f"Flashing {format_progress(event)}")
+
 def build_project():
     run("idf.py build")
 
 def make_spiffs():
-    run(f"{MK_SPIFFS} -c {SPIFFS_IMAGE_DIR} -b 4096 -p 256 -s 0x80000 {SPIFFS_BIN}")
+    run(MKSPIFFS_CMD)
 
-def flash_certs():
-    run(f"esptool.py --port {PORT} write_flash 0x180000 {SPIFFS_BIN}")
+def build_artifacts():
+    cache = ArtifactCache(artifacts=ARTIFACTS)
+    return cache.ensure(lambda: (build_project(), make_spiffs()), params=MKSPIFFS_CMD)
 
-def flash_all():
-    cmd = (
-        f"{IDF_ENV} {ESPIDF} "
-        f"--chip esp32s3 --port {PORT} --baud 460800 "
-        f"write_flash --flash_mode dio --flash_size detect --flash_freq 80m "
-        f"0x8000 {PART_TABLE} "
-        f"0xa0000 {APP_BIN} "
-        f"0x12000 {SPIFFS_BIN}"
-    )
-    run(cmd)
+def flash_all(session, artifacts):
+    for offset, image in merged_images(artifacts, OFFSETS):
+        print(f"Flashing {image} at {offset:#x}")
+        session.write_flash(image, offset)
 
-def read_mac(port):
-    try:
-        result = subprocess.run(
-            ["espefuse.py", "-p", port, "summary"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        match = re.search(r"MAC \(BLOCK1\).*=\s+([0-9a-f:]{17})", result.stdout, re.IGNORECASE)
-        if match:
-            mac = match.group(1)
-            print(f"MAC Address: {mac}")
-            return mac
-    except subprocess.CalledProcessError as e:
-        print("Failed to read MAC:", e)
-    raise RuntimeError("MAC address not found")
+def read_mac(session):
+    mac = session.read_mac()
+    print(f"MAC Address: {mac}")
+    return mac
 
 def main():
     print(f"Using port: {PORT}")
-    build_project()
-    make_spiffs()
-    flash_certs()
-    flash_all()
-    mac = read_mac(PORT)
+    artifacts = build_artifacts()
+    with DeviceSession(PORT, on_progress=show_progress) as session:
+        flash_all(session, artifacts)
+        mac = read_mac(session)
     print(f"Device MAC: {mac}")
 
 if __name__ == "__main__":
@@ -1,60 +1,69 @@
 #!/usr/bin/env python3
 
-/**
+"""
  * File: factory-tool-v1.3.py
  * Description: Flash ESP32, write certs, and extract MAC for factory registration.
  * Created on: 2025-07-25
- * Edited on: 2025-07-27
- * Version: v1.3
+ * Edited on: 2026-10-17
+ * Version: v1.3.7
  * Author: R. Andrew Ballard (c) 2025 "Andwardo"
  * Added regex-based MAC address extraction fix for espefuse.py output
- **/
+ * v1.3.1: flash from the artifact cache; build and mkspiffs only run on input changes
+ * v1.3.2: one compressed write_flash of the pre-merged image instead of two esptool runs
+ * v1.3.3: read just the factory MAC; the summary regex (doubled braces) never matched
+ * v1.3.4: live flash progress (percent, kbit/s) while esptool runs
+ * v1.3.5: header is a docstring; the /** **/ comment kept the script from parsing
+ * v1.3.6: flash and MAC read through one in-process DeviceSession instead of an IDF esptool.py subprocess
+ * v1.3.7: flashes only the partition table, app and spiffs again (no bootloader or
+ *   ota_data), one write per merged image so NVS and phy_init are left as they are
+"""
 
 import subprocess
 import os
 import sys
-import re
+
+from artifact_cache import ArtifactCache
+from flash_image import merged_images
+from flash_progress import format_progress
+from device_session import DeviceSession
 
 PORT = os.environ.get("ESPPORT", "/dev/cu.usbmodem101")
+MKSPIFFS_CMD = "~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin"
+# Written by the esptool command this replaced; the bootloader and ota_data are not.
+ARTIFACTS = {"partition_table": "build/partition_table/partition-table.bin", "app": "build/PianoGuard_DCM-1.bin", "spiffs": "spiffs.bin"}
+# Used when the partition table does not name the partition.
+OFFSETS = {"partition_table": 0x8000, "spiffs": 0x12000, "app": 0xa0000}
 
 def run(cmd, check=True):
     print(f"Running: {cmd}")
     subprocess.run(cmd, shell=True, check=check)
 
+def show_progress(event):
+    print(f"Flashing {format_progress(event)}")
+
 def build_project():
     run("idf.py build")
 
 def create_spiffs():
-    run("~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin")
-
-def flash_spiffs():
-    run(f"esptool.py --port {PORT} write_flash 0x180000 spiffs.bin")
-
-def flash_all():
-    run(f"/Users/andrewballard/.espressif/python_env/idf4.4_py3.9_env/bin/python /Users/andrewballard/esp-idf-v4.4.4/components/esptool_py/esptool/esptool.py "
-        f"--chip esp32s3 --port {PORT} --baud 460800 write_flash --flash_mode dio --flash_size detect --flash_freq 80m "
-        f"0x8000 build/partition_table/partition-table.bin "
-        f"0xa0000 build/PianoGuard_DCM-1.bin "
-        f"0x12000 spiffs.bin")
-
-def read_mac(port):
-    output = subprocess.check_output(
-        f"espefuse.py -p {port} summary",
-        shell=True,
-        text=True
-    )
-    match = re.search(r'MAC \(BLOCK1\).*?([0-9a-f]{{2}}:[0-9a-f]{{2}}:[0-9a-f]{{2}}:[0-9a-f]{{2}}:[0-9a-f]{{2}}:[0-9a-f]{{2}})', output, re.IGNORECASE | re.DOTALL)
-    if match:
-        return match.group(1).lower()
-    raise RuntimeError("MAC address not found")
+    run(MKSPIFFS_CMD)
+
+def build_artifacts():
+    return ArtifactCache(artifacts=ARTIFACTS).ensure(lambda: (build_project(), create_spiffs()), params=MKSPIFFS_CMD)
+
+def flash_all(session, artifacts):
+    for offset, image in merged_images(artifacts, OFFSETS):
+        print(f"Flashing {image} at {offset:#x}")
+        session.write_flash(image, offset)
+
+def read_mac(session):
+    return session.read_mac()
 
 def main():
     print(f"Using port: {PORT}")
-    build_project()
-    create_spiffs()
-    flash_spiffs()
-    flash_all()
-    mac = read_mac(PORT)
+    artifacts = build_artifacts()
+    with DeviceSession(PORT, on_progress=show_progress) as session:
+        flash_all(session, artifacts)
+        mac = read_mac(session)
     print(f"✅ MAC Address: {mac}")
 
 if __name__ == "__main__":
@@ -3,57 +3,76 @@
 # factory-tool-v1.py
 #
 # Created on: 2025-07-29
-# Edited on: 2025-07-29
+# Edited on: 2026-10-17
 #     Author: Andwardo
-#     Version: v1.1.1
+#     Version: v1.1.7
 #
 # v1.1.1 - Integrated full ESP32 flash and spiffs sequence into factory app logic
+# v1.1.2 - Flash from the artifact cache; build and mkspiffs only run on input changes
+# v1.1.3 - One compressed write_flash of the pre-merged image instead of two esptool runs
+# v1.1.4 - Read just the factory MAC instead of dumping the espefuse.py summary
+# v1.1.5 - Live flash progress (percent, kbit/s) while esptool runs
+# v1.1.6 - Flash and MAC read through one in-process DeviceSession instead of IDF esptool.py subprocesses
+# v1.1.7 - Flashes only the partition table, app and spiffs again (no bootloader or ota_data),
+#          one write per merged image so NVS and phy_init are left as they are
 #
 
 import subprocess
 import os
 import sys
 
+from artifact_cache import ArtifactCache
+from flash_image import merged_images
+from flash_progress import format_progress
+from device_session import DeviceSession
+
 DEFAULT_PORT = "/dev/cu.usbmodem101"
 MK_SPIFFS = os.path.expanduser("~/mkspiffs/bin/mkspiffs")
-ESPTOOL = os.path.expanduser("~/.espressif/python_env/idf4.4_py3.9_env/bin/python") +           " " + os.path.expanduser("~/esp-idf-v4.4.4/components/esptool_py/esptool/esptool.py")
 
 def run(cmd, check=True):
     print(f"Running: {cmd}")
     subprocess.run(cmd, shell=True, check=check)
 
+def show_progress(event):
+    print(f"Flashing {format_progress(event)}")
+
 def build_project():
     run("idf.py build")
 
+MKSPIFFS_CMD = f"{MK_SPIFFS} -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin"
+# Written by the esptool command this replaced; the bootloader and ota_data are not.
+ARTIFACTS = {"partition_table": "build/partition_table/partition-table.bin", "app": "build/PianoGuard_DCM-1.bin", "spiffs": "spiffs.bin"}
+# Used when the partition table does not name the partition.
+OFFSETS = {"partition_table": 0x8000, "spiffs": 0x12000, "app": 0xa0000}
+
 def create_spiffs():
-    run(f"{MK_SPIFFS} -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin")
+    run(MKSPIFFS_CMD)
 
-def flash_certs(port):
-    run(f"esptool.py --port {port} write_flash 0x180000 spiffs.bin")
+def build_artifacts():
+    return ArtifactCache(artifacts=ARTIFACTS).ensure(lambda: (build_project(), create_spiffs()), params=MKSPIFFS_CMD)
 
-def flash_all(port):
-    run(f"{ESPTOOL} --chip esp32s3 --port {port} --baud 460800 "
-        "write_flash --flash_mode dio --flash_size detect --flash_freq 80m "
-        "0x8000 build/partition_table/partition-table.bin "
-        "0xa0000 build/PianoGuard_DCM-1.bin "
-        "0x12000 spiffs.bin")
+def flash_all(session, artifacts):
+    for offset, image in merged_images(artifacts, OFFSETS):
+        print(f"Flashing {image} at {offset:#x}")
+        session.write_flash(image, offset)
 
-def flash_app_only(port):
-    run(f"esptool.py --chip esp32s3 --port {port} --baud 921600 "
-        "write_flash 0x10000 build/PianoGuard_DCM-1.bin")
+def flash_app_only(session, artifacts):
+    print(f"Flashing {artifacts['app']} at 0x10000")
+    session.write_flash(artifacts["app"], 0x10000)
 
-def read_mac(port):
-    run(f"espefuse.py -p {port} summary")
+def read_mac(session):
+    mac = session.read_mac()
+    print(f"MAC Address: {mac}")
+    return mac
 
 def main():
     port = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT
     print(f"Using port: {port}")
 
-    build_project()
-    create_spiffs()
-    flash_certs(port)
-    flash_all(port)
-    read_mac(port)
+    artifacts = build_artifacts()
+    with DeviceSession(port, on_progress=show_progress) as session:
+        flash_all(session, artifacts)
+        read_mac(session)
 
 if __name__ == "__main__":
     main()
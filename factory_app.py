@@ -3,80 +3,99 @@
  * File: factory_app.py
  * Description: PianoGuard factory flashing and registration utility.
  * Created on: 2025-07-25
- * Edited on: 2025-07-27
- * Version: v1.4
+ * Edited on: 2026-10-17
+ * Version: v1.9.3
  * Author: R. Andrew Ballard (c) 2025 "Andwardo"
  * Summarize the edits in this version
  * - Added .env support using python-dotenv to load PIANOGUARD_FACTORY_KEY
+ * - v1.5: build and spiffs outputs come from the artifact cache; idf.py build
+ *   and mkspiffs only run when their inputs change
+ * - v1.6: app, partitions and spiffs go out in one compressed write_flash of
+ *   the pre-merged image
+ * - v1.7: flash and MAC read go through one in-process DeviceSession instead of
+ *   the IDF esptool.py and espefuse.py subprocesses
+ * - v1.8: MAC is registered in the canonical aa:bb:cc:dd:ee:ff form shared by
+ *   every tool (was upper-case hex without separators)
+ * - v1.9: registration through RegistrationClient: 10 s timeout (there was
+ *   none), retries with backoff on 5xx/timeouts, latency logged per request
+ * - v1.9.1: /register-device gets the MAC as upper-case hex without separators
+ *   again, as the backend expects; the canonical form stays inside the tool
+ * - v1.9.2: one write per merged image; NVS and phy_init between the
+ *   partition table and the app are no longer erased
+ * - v1.9.3: live flash progress (percent, kbit/s) like the factory-tool scripts
 """
 
 import os
 import subprocess
-import re
-import requests
 from dotenv import load_dotenv
 
+from artifact_cache import ArtifactCache
+from flash_image import merged_images
+from flash_progress import format_progress
+from device_session import DeviceSession
+from registration import RegistrationClient
+
 # Load .env file from current directory
 load_dotenv()
 
 PORT = "/dev/cu.usbmodem101"
+API_BASE = "https://dev1.pgapi.net"
 SERIAL_NUMBER = "TEST123"
 FACTORY_KEY = os.getenv("PIANOGUARD_FACTORY_KEY", "DEVKEY123")
-FLASH_CMD = f"""
-~/.espressif/python_env/idf4.4_py3.9_env/bin/python ~/esp-idf-v4.4.4/components/esptool_py/esptool/esptool.py \\
-  --chip esp32s3 --port {PORT} --baud 460800 \\
-  write_flash --flash_mode dio --flash_size detect --flash_freq 80m \\
-  0x0 build/bootloader/bootloader.bin \\
-  0x8000 build/partition_table/partition-table.bin \\
-  0xf000 build/ota_data_initial.bin \\
-  0xa0000 build/PianoGuard_DCM-1.bin
-"""
-
-SPIFFS_CMD = f"esptool.py --port {PORT} write_flash 0x12000 spiffs.bin"
+MKSPIFFS_CMD = "~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin"
+# Used when the partition table does not name the partition.
+OFFSETS = {"bootloader": 0x0, "partition_table": 0x8000, "ota_data": 0xf000, "spiffs": 0x12000, "app": 0xa0000}
 
 def run(cmd, check=True):
     print(f"Running: {cmd}")
     subprocess.run(cmd, shell=True, check=check)
 
+def show_progress(event):
+    print(f"Flashing {format_progress(event)}")
+
 def build_project():
     run("idf.py build")
 
 def make_spiffs():
-    run("~/mkspiffs/bin/mkspiffs -c ./spiffs_image -b 4096 -p 256 -s 0x80000 ./spiffs.bin")
+    run(MKSPIFFS_CMD)
 
-def flash_firmware():
-    run(FLASH_CMD)
+def build_artifacts():
+    return ArtifactCache().ensure(lambda: (build_project(), make_spiffs()), params=MKSPIFFS_CMD)
 
-def flash_spiffs():
-    run(SPIFFS_CMD)
+def flash_firmware(session, artifacts):
+    for offset, image in merged_images(artifacts, OFFSETS):
+        print(f"Flashing {image} at {offset:#x}")
+        session.write_flash(image, offset)
 
-def read_mac(port):
-    print(f"Reading MAC address on {port}")
-    output = subprocess.check_output(["espefuse.py", "-p", port, "summary"], text=True)
-    match = re.search(r"MAC \(BLOCK1\)\s+Factory MAC Address\s+= ([0-9a-f:]+)", output, re.IGNORECASE)
-    if match:
-        return match.group(1).replace(":", "").upper()
+def read_mac(session):
+    print(f"Reading MAC address on {session.port}")
+    mac = session.read_mac()
+    if mac:
+        return mac
     raise RuntimeError("MAC address not found")
 
+def api_mac(mac):
+    # /register-device takes "7CDFA1001122", not the canonical "7c:df:a1:00:11:22".
+    return mac.replace(":", "").upper()
+
 def register_device(mac, serial):
     print(f"Registering device with MAC={mac}")
     payload = {
         "factory_key": FACTORY_KEY,
         "serial": serial,
-        "mac": mac
+        "mac": api_mac(mac)
     }
-    resp = requests.post("https://dev1.pgapi.net/register-device", json=payload)
+    resp = RegistrationClient(API_BASE).post("/register-device", payload)
     print(resp.text)
     if not resp.ok:
         raise RuntimeError("Registration failed")
 
 def main():
     print(f"Using port: {PORT}")
-    build_project()
-    make_spiffs()
-    flash_firmware()
-    flash_spiffs()
-    mac = read_mac(PORT)
+    artifacts = build_artifacts()
+    with DeviceSession(PORT, on_progress=show_progress) as session:
+        flash_firmware(session, artifacts)
+        mac = read_mac(session)
     register_device(mac, SERIAL_NUMBER)
     print("✅ Factory flash and registration complete")
 
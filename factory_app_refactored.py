@@ -3,39 +3,58 @@
 # factory_app_refactored.py
 #
 # Created on: 2025-06-25
-# Edited on: 2025-07-20
+# Edited on: 2026-10-17
 #     Author: Andwardo
-#     Version: v1.1.0
+#     Version: v1.4.3
 #
 # v1.1.0 - Refactored for maintainability, CLI extensibility, and firmware version control
+# v1.2.0 - Workflow steps moved to provisioning.py; added multi-port station panel
+# v1.2.1 - "Differential flash" option for reworked / returned units
+# v1.2.2 - Station summary shows registrations still waiting in the outbox
+# v1.2.3 - Fixtures show "released" once flashed; units finishing in the background are counted
+# v1.3.0 - Workflow runs on a worker thread; logs and results reach Tk through an
+#          event queue drained in batches on an after() timer
+# v1.3.1 - Live flash progress bar (percent, kbit/s) for the single unit and per fixture
+# v1.3.2 - Batch labels: station units print together as lot sheets, one job per sheet
+# v1.3.3 - ZPL labels have no preview image; only the ID is shown
+# v1.4.0 - Auto-start: a fixture starts as soon as an ESP32-S3 is plugged in (port_watcher)
+# v1.4.1 - Station summary shows backend request latency
+# v1.4.2 - Auto-start retries a failed board when it is plugged in again
+# v1.4.3 - ...only after a real unplug, not when its session resets it
 #
 
-import subprocess
-import hashlib
-import requests
 import os
-import platform
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import qrcode
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from PIL import ImageTk
 
-API_SERVER_URL = "https://45.56.69.50"
-FACTORY_API_KEY = os.environ.get("PIANOGUARD_FACTORY_KEY", "your_super_secret_factory_key")
-DEFAULT_PORT = "/dev/cu.usbmodem101"
-LABEL_DIR = "labels"
-COUNTER_FILE = os.path.join(LABEL_DIR, "unit_counter.txt")
+from flash_progress import format_progress
+from label_sheets import LETTER, print_lot
+from port_watcher import PortWatcher
+from provisioning import ProvisioningWorkflow, DEFAULT_PORT, LABEL_DIR, get_registration_outbox, registration_client
+from station import ProvisioningStation
+
+EVENT_POLL_MS = 50
+MAX_EVENTS_PER_TICK = 500
 
 class FactoryProvisioningApp:
     def __init__(self, root):
         self.root = root
-        self.root.title("PianoGuard Factory Provisioning Tool v1.1")
-        self.root.geometry("600x700")
+        self.root.title("PianoGuard Factory Provisioning Tool v1.3")
+        self.root.geometry("700x1000")
 
         self.style = ttk.Style(self.root)
         self.style.theme_use('clam')
         os.makedirs(LABEL_DIR, exist_ok=True)
+        self.events = queue.Queue()
+        self.worker = None
+        self.station = None
+        self.port_watcher = None
+        self.port_panes = {}
         self.create_widgets()
+        self.root.after(EVENT_POLL_MS, self._pump_events)
 
     def create_widgets(self):
         main_frame = ttk.Frame(self.root, padding="20")
@@ -46,10 +65,19 @@ class FactoryProvisioningApp:
         self.port_entry.insert(0, DEFAULT_PORT)
         self.port_entry.pack(pady=5, fill=tk.X)
 
+        self.diff_flash_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(main_frame, text="Differential flash (rework / returned units)",
+                        variable=self.diff_flash_var).pack(pady=5, anchor="w")
+
         self.run_button = ttk.Button(main_frame, text="Start Full Provisioning Process", command=self.run_provisioning_workflow, style="Accent.TButton")
         self.run_button.pack(pady=20, fill=tk.X, ipady=10)
         self.style.configure("Accent.TButton", font=("Helvetica", 14, "bold"), foreground="white", background="#007bff")
 
+        self.flash_progress_bar = ttk.Progressbar(main_frame, maximum=100)
+        self.flash_progress_bar.pack(fill=tk.X)
+        self.flash_progress_label = ttk.Label(main_frame, text="Flash: -")
+        self.flash_progress_label.pack(anchor="w")
+
         ttk.Separator(main_frame, orient="horizontal").pack(pady=10, fill=tk.X)
 
         ttk.Label(main_frame, text="Process Log:", font=("Helvetica", 12)).pack(pady=5, anchor="w")
@@ -63,157 +91,211 @@ class FactoryProvisioningApp:
         self.human_readable_id_label = ttk.Label(self.label_frame, text="Human-Readable ID: -", font=("Courier", 14, "bold"))
         self.human_readable_id_label.pack(pady=5)
 
+        self.create_station_widgets(main_frame)
+
+    def create_station_widgets(self, parent):
+        station_frame = ttk.LabelFrame(parent, text="Station (parallel fixtures)", padding="10")
+        station_frame.pack(pady=10, fill=tk.BOTH, expand=True)
+
+        ttk.Label(station_frame, text="Fixture ports (comma separated):").pack(anchor="w")
+        self.station_ports_entry = ttk.Entry(station_frame, font=("Helvetica", 12))
+        self.station_ports_entry.pack(pady=5, fill=tk.X)
+
+        self.station_button = ttk.Button(station_frame, text="Start Idle Fixtures", command=self.run_station)
+        self.station_button.pack(pady=5, fill=tk.X)
+
+        self.auto_start_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(station_frame, text="Auto-start fixtures when a board is plugged in",
+                        variable=self.auto_start_var, command=self.toggle_auto_start).pack(anchor="w")
+        self.batch_labels_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(station_frame, text="Batch labels (print the lot as sheets)",
+                        variable=self.batch_labels_var).pack(anchor="w")
+        self.print_lot_button = ttk.Button(station_frame, text="Print Label Sheets", command=self.print_label_sheets)
+        self.print_lot_button.pack(pady=5, fill=tk.X)
+        self.station_summary_label = ttk.Label(station_frame, text="Units: 0 passed / 0 failed")
+        self.station_summary_label.pack(anchor="w")
+
+        self.port_notebook = ttk.Notebook(station_frame)
+        self.port_notebook.pack(pady=5, fill=tk.BOTH, expand=True)
+
+    def _port_pane(self, port):
+        if port not in self.port_panes:
+            frame = ttk.Frame(self.port_notebook)
+            status = ttk.Label(frame, text="idle")
+            status.pack(anchor="w")
+            bar = ttk.Progressbar(frame, maximum=100)
+            bar.pack(fill=tk.X)
+            text = scrolledtext.ScrolledText(frame, wrap=tk.WORD, height=8, font=("Courier", 10))
+            text.pack(fill=tk.BOTH, expand=True)
+            self.port_notebook.add(frame, text=os.path.basename(port))
+            self.port_panes[port] = {"status": status, "progress": bar, "log": text}
+        return self.port_panes[port]
+
+    def run_station(self):
+        ports = [p.strip() for p in self.station_ports_entry.get().split(",") if p.strip()]
+        if not ports:
+            messagebox.showerror("Error", "Enter at least one fixture port.")
+            return
+        self._start_fixtures(ports)
+
+    def _start_fixtures(self, ports):
+        if self.station is None:
+            self.station = ProvisioningStation(ports)
+        diff, batch = self.diff_flash_var.get(), self.batch_labels_var.get()
+        self.station.workflow_factory = lambda **kw: ProvisioningWorkflow(diff_flash=diff, batch_labels=batch, **kw)
+        for port in self.station.start(ports):
+            pane = self._port_pane(port)
+            pane["log"].delete(1.0, tk.END)
+
+    def toggle_auto_start(self):
+        if self.auto_start_var.get():
+            # Arrivals come in on the watcher thread; the pump starts them on the Tk thread.
+            self.port_watcher = PortWatcher(lambda port: self.events.put(("arrival", port.device, port)),
+                                            log=self.log).start()
+            self.log(f"INFO: Watching for ESP32-S3 boards "
+                     f"({len(self.port_watcher.present())} already connected, not started).")
+        elif self.port_watcher:
+            self.port_watcher.stop()
+            self.port_watcher = None
+            self.log("INFO: Stopped watching for boards.")
+
+    def print_label_sheets(self):
+        if self.station is None:
+            messagebox.showerror("Error", "No station units to print yet.")
+            return
+        results = self.station.results.results()
+        # Rendering and lp run off the Tk thread; progress lands in the process log.
+        threading.Thread(target=print_lot, args=(results, LABEL_DIR, LETTER), kwargs={"log": self.log},
+                         name="print-lot", daemon=True).start()
+
+    def _update_station_summary(self):
+        summary = self.station.results.summary()
+        registrations = get_registration_outbox().counts()
+        self.station_summary_label.config(
+            text=f"Units: {summary['passed']} passed / {summary['failed']} failed /"
+                 f" {summary['in_flight']} finishing"
+                 f" ({summary['units_per_hour']:.0f} units/hour),"
+                 f" {registrations['pending']} registrations pending\n"
+                 f"Backend: {registration_client.stats.describe()}")
+
     def log(self, message):
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        # Safe from any thread; the pump writes it out on the Tk thread.
+        self.events.put(("log", None, message))
 
     def run_provisioning_workflow(self):
-        self.run_button.config(state=tk.DISABLED)
-        self.log_text.delete(1.0, tk.END)
         port = self.port_entry.get()
-
         if not port:
             messagebox.showerror("Error", "Serial port cannot be empty.")
-            self.run_button.config(state=tk.NORMAL)
+            return
+        if self.worker and self.worker.is_alive():
             return
 
-        try:
-            self.log(">>> [STEP 1/5] Flashing Firmware...")
-            self.flash_firmware(port)
-            self.log("SUCCESS: Firmware flash complete.")
-
-            self.log("\n>>> [STEP 2/5] Reading MAC Address...")
-            mac_address = self.get_mac_address(port)
-
-            self.log(f"\n>>> [STEP 3/5] Hashing Device ID from MAC ({mac_address})...")
-            device_id_hash = self.hash_id(mac_address)
-
-            self.log(f"\n>>> [STEP 4/5] Pre-registering Device in Database...")
-            if self.pre_register_device_in_db(device_id_hash):
-                self.log(f"\n>>> [STEP 5/5] Generating Label Info...")
-                self.generate_label_info(device_id_hash)
+        self.run_button.config(state=tk.DISABLED)
+        self.log_text.delete(1.0, tk.END)
+        self.flash_progress_bar["value"] = 0
+        self.flash_progress_label.config(text="Flash: -")
+        diff_flash = self.diff_flash_var.get()
+        self.worker = threading.Thread(target=self._run_workflow, args=(port, diff_flash),
+                                       name="provisioning", daemon=True)
+        self.worker.start()
+
+    def _run_workflow(self, port, diff_flash):
+        workflow = ProvisioningWorkflow(log=self.log, diff_flash=diff_flash,
+                                        on_progress=lambda event: self.events.put(("progress", None, event)))
+        result = workflow.run(port)
+        self.events.put(("done", None, result))
+
+    def _workflow_done(self, result):
+        if result["status"] == "passed":
+            self.human_readable_id_label.config(text=f"Human-Readable ID: {result['short_id']}")
+            if result.get("label_image") is not None:
+                self.qr_photo_image = ImageTk.PhotoImage(result["label_image"])
+                self.qr_code_label.config(image=self.qr_photo_image)
             else:
-                raise RuntimeError("Could not pre-register device. Aborting.")
-
+                self.qr_photo_image = None
+                self.qr_code_label.config(image="")
             messagebox.showinfo("Success", "Device provisioning completed successfully!")
-
-        except Exception as e:
-            self.log(f"\n---!!!-!!!---\nERROR: {e}\n---!!!-!!!---")
-            messagebox.showerror("Provisioning Failed", f"An error occurred: {e}")
-        finally:
-            self.run_button.config(state=tk.NORMAL)
-
-    def flash_firmware(self, port):
-        firmware_bin = "build/firmware.bin"
-        if not os.path.exists(firmware_bin):
-            raise RuntimeError("Firmware binary not found. Build it first.")
-        cmd = [
-            "esptool.py", "--chip", "esp32s3", "--port", port, "--baud", "460800", "write_flash",
-            "0x0", "build/bootloader/bootloader.bin",
-            "0x8000", "build/partition_table/partition-table.bin",
-            "0x10000", firmware_bin
-        ]
-        subprocess.run(cmd, check=True, timeout=60)
-
-    def get_mac_address(self, port):
-        cmd = ["esptool.py", "--port", port, "read_mac"]
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=15)
-        for line in result.stdout.splitlines():
-            if "MAC:" in line:
-                mac = line.split("MAC:")[1].strip()
-                self.log(f"SUCCESS: Found MAC Address: {mac}")
-                return mac
-        raise RuntimeError("MAC address not found.")
-
-    def hash_id(self, input_string):
-        sha256 = hashlib.sha256(input_string.encode("utf-8")).hexdigest()
-        self.log(f"SUCCESS: Hashed to {sha256[:20]}...")
-        return sha256
-
-    def pre_register_device_in_db(self, device_id):
-        url = f"{API_SERVER_URL}/api/factory/provision"
-        headers = {"Content-Type": "application/json", "x-factory-api-key": FACTORY_API_KEY}
-        payload = {"mac_hash": device_id}
-
-        response = requests.post(url, headers=headers, json=payload, timeout=10, verify=False)
-        self.log(f"API Response Status: {response.status_code}")
-        response.raise_for_status()
-        self.log(f"SUCCESS: {response.json().get('message')}")
-        return True
-
-    def get_next_unit_number(self):
-        if os.path.exists(COUNTER_FILE):
-            with open(COUNTER_FILE) as f:
-                count = int(f.read().strip()) + 1
         else:
-            count = 1
-        with open(COUNTER_FILE, "w") as f:
-            f.write(str(count))
-        return f"{count:03}"
-
-    def generate_label_info(self, full_hash):
-        short_id = f"{full_hash[:4].upper()}-{full_hash[4:8].upper()}"
-        self.human_readable_id_label.config(text=f"Human-Readable ID: {short_id}")
+            messagebox.showerror("Provisioning Failed", f"An error occurred: {result['error']}")
+        self.run_button.config(state=tk.NORMAL)
 
-        qr_img = self._create_qr_image(full_hash)
-        labeled_img = self._add_text_below_image(qr_img, short_id)
-
-        unit_num = self.get_next_unit_number()
-        base_path = os.path.join(LABEL_DIR, f"device_{unit_num}_{short_id}")
-        self._save_qr_assets(labeled_img, base_path, full_hash, short_id)
-
-        if platform.system() == "Darwin":
-            self._attempt_print(f"{base_path}.png")
-        else:
-            self.log("INFO: Auto-printing only supported on macOS")
-
-        self.qr_photo_image = ImageTk.PhotoImage(labeled_img)
-        self.qr_code_label.config(image=self.qr_photo_image)
-        self.log("SUCCESS: Label info generated and saved.")
-
-    def _create_qr_image(self, data):
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=4,
-            border=2
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        return qr.make_image(fill_color="black", back_color="white").convert('RGB')
-
-    def _add_text_below_image(self, image, text):
-        width, height = image.size
-        font_size = 16
+    def _pump_events(self):
+        handled = 0
         try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-
-        draw = ImageDraw.Draw(image)
-        bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-
-        new_image = Image.new("RGB", (width, height + text_height + 10), "white")
-        new_image.paste(image, (0, 0))
-        draw = ImageDraw.Draw(new_image)
-        draw.text(((width - text_width) / 2, height + 5), text, fill="black", font=font)
-        return new_image
-
-    def _save_qr_assets(self, img, base_path, full_hash, short_id):
-        img.save(f"{base_path}.png")
-        with open(f"{base_path}.txt", "w") as f:
-            f.write(f"MAC Hash: {full_hash}\n")
-            f.write(f"Human-Readable ID: {short_id}\n")
-
-    def _attempt_print(self, img_path):
-        try:
-            subprocess.run(["lp", img_path], check=True)
-            self.log(f"SUCCESS: Printed label: {img_path}")
-        except subprocess.CalledProcessError as e:
-            self.log(f"WARNING: Print failed: {e}")
+            handled = self._drain_events()
+        finally:
+            # Come straight back if there is a backlog, otherwise idle until the next tick.
+            self.root.after(1 if handled == MAX_EVENTS_PER_TICK else EVENT_POLL_MS, self._pump_events)
+
+    def _drain_events(self):
+        """Handle queued worker events on the Tk thread, one text insert per log pane."""
+        sources = [self.events] + ([self.station.events] if self.station else [])
+        lines = {}
+        progress = {}
+        deferred = []
+        handled = 0
+        for events in sources:
+            while handled < MAX_EVENTS_PER_TICK:
+                try:
+                    kind, port, payload = events.get_nowait()
+                except queue.Empty:
+                    break
+                handled += 1
+                if kind == "log":
+                    lines.setdefault(port, []).append(payload)
+                elif kind == "progress":
+                    # Only the latest position per fixture is worth drawing.
+                    progress[port] = payload
+                else:
+                    deferred.append((kind, port, payload))
+
+        for port, batch in lines.items():
+            widget = self.log_text if port is None else self._port_pane(port)["log"]
+            widget.insert(tk.END, "\n".join(batch) + "\n")
+            widget.see(tk.END)
+
+        for port, event in progress.items():
+            if port is None:
+                self.flash_progress_bar["value"] = event["percent"]
+                self.flash_progress_label.config(text=f"Flash: {format_progress(event)}")
+            else:
+                pane = self._port_pane(port)
+                pane["progress"]["value"] = event["percent"]
+                pane["status"].config(text=f"running - flash {format_progress(event)}")
+
+        summary_dirty = False
+        for kind, port, payload in deferred:
+            if kind == "done":
+                self._workflow_done(payload)
+            elif kind == "arrival":
+                self.log(f"INFO: Board plugged in: {payload}")
+                self._start_fixtures([port])
+            elif kind == "state":
+                pane = self._port_pane(port)
+                if payload["status"] == "running" and payload["step"] in (None, "flash"):
+                    pane["progress"]["value"] = 0
+                text = payload["status"]
+                if payload["step"] and payload["status"] == "running":
+                    text += f" - {payload['step']}"
+                if payload["status"] == "released":
+                    text += f" - {payload['mac_address']} - unplug and load the next board"
+                if payload["error"]:
+                    text += f" - {payload['error']}"
+                pane["status"].config(text=text)
+                summary_dirty = True
+            elif kind == "unit":
+                pane = self._port_pane(port)
+                outcome = payload["status"].upper()
+                if payload.get("short_id"):
+                    outcome += f" {payload['short_id']}"
+                pane["log"].insert(tk.END, f"[{payload.get('mac_address') or port}] UNIT {outcome}\n")
+                if self.port_watcher and payload["status"] != "passed":
+                    self.port_watcher.mark_failed(port)
+                pane["log"].see(tk.END)
+                summary_dirty = True
+        if summary_dirty:
+            self._update_station_summary()
+        return handled
 
 if __name__ == "__main__":
     root = tk.Tk()
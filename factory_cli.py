@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#
+# factory_cli.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.1.5
+#
+# v1.0.0 - Headless entry point on the same workflow core as the GUI. No Tk,
+#          and PIL/qrcode only if a PNG label or a lot sheet is drawn, so
+#          rigs and scripts can drive fixtures without a display.
+# v1.0.1 - --simulate: run on simulated boards (sim_device), no hardware needed
+# v1.0.2 - --metrics-port serves the step timings at /metrics; spans flushed on exit
+# v1.1.0 - run --watch: start a fixture whenever an ESP32-S3 is plugged in (port_watcher)
+# v1.1.1 - Summary includes backend request latency
+# v1.1.2 - --watch retries a failed board when it is plugged in again
+# v1.1.3 - export brings registration status over from the outbox first; lot taken at run time
+# v1.1.4 - --watch retries a failed board only after it is really unplugged (not on its reset)
+# v1.1.5 - Registration client / outbox messages follow --json and --quiet like the unit logs
+#
+# Usage:
+#   ./factory_cli.py run /dev/cu.usbmodem101 /dev/cu.usbmodem201 --lot 20261017A
+#   ./factory_cli.py run /dev/ttyACM0 --labels zpl --printer tcp://10.0.0.40:9100 --json
+#   ./factory_cli.py run sim0 sim1 sim2 --simulate "kbit_s=900,link_error_rate=0.05"
+#   ./factory_cli.py run /dev/ttyACM0 /dev/ttyACM1 --metrics-port 9464
+#   ./factory_cli.py run --watch --lot 20261017A
+#   ./factory_cli.py export units.csv --lot 20261017A
+#   ./factory_cli.py sheets --lot 20261017A --layout roll
+#
+
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+
+
+def _configure(args):
+    # provisioning reads these at import, so they are set before it is loaded.
+    if getattr(args, "lot", None):
+        os.environ["PIANOGUARD_LOT"] = args.lot
+    if getattr(args, "labels", None):
+        os.environ["PIANOGUARD_LABEL_BACKEND"] = args.labels
+    if getattr(args, "printer", None):
+        os.environ["PIANOGUARD_LABEL_PRINTER"] = args.printer
+    if getattr(args, "simulate", None) is not None:
+        os.environ["PIANOGUARD_DEVICE"] = "sim"
+        os.environ["PIANOGUARD_SIM"] = args.simulate
+
+
+def run(args):
+    from provisioning import (ProvisioningWorkflow, get_registration_outbox, registration_client, set_background_log,
+                              PASSED, PENDING)
+    from station import ProvisioningStation
+    from metrics import tracer
+
+    # With --json stdout carries one result per line and nothing else.
+    out = sys.stderr if args.json else sys.stdout
+
+    def background_log(message):
+        if not args.quiet:
+            print(message, file=out, flush=True)
+
+    set_background_log(background_log)
+    if args.metrics_port:
+        tracer.serve(args.metrics_port)
+        print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics", file=out)
+
+    def workflow_factory(**kw):
+        return ProvisioningWorkflow(diff_flash=args.diff_flash, batch_labels=args.batch_labels, **kw)
+
+    station = ProvisioningStation(args.ports, workflow_factory=workflow_factory)
+    if args.ports:
+        station.start()
+    units = []
+    watcher = None
+    if args.watch:
+        from port_watcher import PortWatcher
+
+        def on_arrival(port):
+            station.events.put(("log", port.device, f"INFO: Board plugged in: {port}"))
+            station.start([port.device])
+
+        watcher = PortWatcher(on_arrival, log=lambda message: print(message, file=out)).start()
+        print(f"Watching for ESP32-S3 boards ({len(watcher.present())} already connected, not started); "
+              f"Ctrl-C to stop.", file=out, flush=True)
+        try:
+            _print_events(station, threading.Event(), args, out, units, watcher)
+        except KeyboardInterrupt:
+            print("Stopping; finishing the units already started...", file=out, flush=True)
+        watcher.stop()
+
+    done = threading.Event()
+
+    def wait():
+        try:
+            station.wait()
+        finally:
+            done.set()
+
+    threading.Thread(target=wait, name="cli-wait", daemon=True).start()
+    _print_events(station, done, args, out, units)
+    station.shutdown()
+
+    outbox = get_registration_outbox()
+    try:
+        outbox.flush_once()
+    except Exception as e:
+        print(f"WARNING: Final registration flush failed: {e}", file=out)
+    tracer.flush()
+    summary = station.results.summary()
+    print(f"{summary['passed']} passed, {summary['failed']} failed, "
+          f"{outbox.counts()[PENDING]} registration(s) still queued", file=out)
+    print(f"Registration: {registration_client.stats.describe()}", file=out)
+    return 0 if units and all(u["status"] == PASSED for u in units) else 1
+
+
+def _print_events(station, done, args, out, units, watcher=None):
+    """Print station events until `done` is set and the queue is empty; unit results go into `units`.
+
+    A failed unit is marked on `watcher`, so unplugging and replugging the board starts it again.
+    """
+    from provisioning import PASSED
+
+    while not (done.is_set() and station.events.empty()):
+        try:
+            kind, port, payload = station.events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if kind == "log" and not args.quiet:
+            for line in payload.strip("\n").splitlines():
+                print(f"[{port}] {line}", file=out, flush=True)
+        elif kind == "unit":
+            units.append(payload)
+            if watcher and payload["status"] != PASSED:
+                watcher.mark_failed(port)
+            if args.json:
+                print(json.dumps(payload, default=str), flush=True)
+            else:
+                print(f"[{port}] UNIT {payload['status'].upper()} {payload.get('short_id') or ''} "
+                      f"{payload.get('error') or ''}".rstrip(), file=out, flush=True)
+
+
+def export(args):
+    from production_db import ProductionDB, PRODUCTION_DB
+    from outbox import OUTBOX_DB
+
+    db = ProductionDB(args.db or PRODUCTION_DB)
+    # Catch up on anything on_settled missed (a failed write, a station stopped mid-flush).
+    db.sync_registration(OUTBOX_DB)
+    count = db.export(args.path, lot=args.lot)
+    print(f"Exported {count} unit(s) to {args.path}")
+    return 0
+
+
+def sheets(args):
+    from production_db import ProductionDB, PRODUCTION_DB
+    from provisioning import LABEL_DIR, current_lot
+    import label_sheets
+
+    lot = args.lot or current_lot()
+    results = [dict(u, device_id=u["mac_hash"]) for u in ProductionDB(args.db or PRODUCTION_DB).lot(lot)]
+    path = label_sheets.print_lot(results, args.output or LABEL_DIR, label_sheets.LAYOUTS[args.layout],
+                                  print_pages=not args.no_print)
+    return 0 if path else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="PianoGuard factory provisioning, headless.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("run", help="provision the boards on one or more fixture ports")
+    p.add_argument("ports", nargs="*", help="serial ports, one per fixture")
+    p.add_argument("--watch", action="store_true",
+                   help="start a fixture whenever an ESP32-S3 is plugged in, until Ctrl-C")
+    p.add_argument("--lot", help="production lot recorded with each unit (default: today)")
+    p.add_argument("--diff-flash", action="store_true", help="differential flash (rework / returned units)")
+    p.add_argument("--batch-labels", action="store_true", help="no per-unit labels; print the lot with 'sheets'")
+    p.add_argument("--labels", choices=("png", "zpl"), help="label backend")
+    p.add_argument("--printer", help="ZPL target: a directory, spool:<dir> or tcp://host:9100")
+    p.add_argument("--json", action="store_true", help="one JSON result per unit on stdout")
+    p.add_argument("--quiet", action="store_true", help="only print unit results")
+    p.add_argument("--simulate", nargs="?", const="", metavar="SPEC",
+                   help="simulated boards instead of serial ports, e.g. 'kbit_s=900,connect_error_rate=0.1'")
+    p.add_argument("--metrics-port", type=int, metavar="PORT",
+                   help="serve Prometheus metrics on 127.0.0.1:PORT while running")
+    p.set_defaults(func=run)
+
+    p = commands.add_parser("export", help="export the production DB to .csv or .jsonl")
+    p.add_argument("path")
+    p.add_argument("--lot")
+    p.add_argument("--db", help="production DB path")
+    p.set_defaults(func=export)
+
+    p = commands.add_parser("sheets", help="render (and print) a lot's labels as sheets")
+    p.add_argument("--lot")
+    p.add_argument("--layout", choices=("letter", "roll"), default="letter")
+    p.add_argument("--output", help="directory for the PDF/CSV (default: labels/)")
+    p.add_argument("--no-print", action="store_true")
+    p.add_argument("--db", help="production DB path")
+    p.set_defaults(func=sheets)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "run" and not (args.ports or args.watch):
+        parser.error("run needs at least one port, or --watch")
+    _configure(args)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
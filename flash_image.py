@@ -0,0 +1,172 @@
+#
+# flash_image.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.2
+#
+# v1.0.0 - Pre-merge the cached bootloader, partition table, ota_data, app and
+#          spiffs images into one 0xFF-padded image per layout, so each unit
+#          gets a single compressed write_flash at one offset.
+# v1.0.1 - Region digests stored beside each merged image (flash_verify); artifact
+#          digests remembered by size/mtime instead of re-read for every unit
+# v1.0.2 - merged_images(): one image per run of artifacts with no whole free
+#          sector between them, so NVS, phy_init and any other partition that
+#          is not being written is never erased (as with esptool's multi-file
+#          write_flash); was one image with 0xFF over every gap
+#
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+
+from artifact_cache import CACHE_DIR
+from flash_verify import image_regions, write_regions
+
+MERGED_DIR = os.path.join(CACHE_DIR, "merged")
+
+# Erase unit; an image is always written whole sectors at a time.
+FLASH_SECTOR_SIZE = 0x1000
+BOOTLOADER_OFFSET = 0x0
+PARTITION_TABLE_OFFSET = 0x8000
+
+# ESP-IDF partition table entry: magic, type, subtype, offset, size, label, flags
+PARTITION_ENTRY = struct.Struct("<HBBII16sI")
+PARTITION_MAGIC = 0xAA50
+TYPE_APP, TYPE_DATA = 0x00, 0x01
+SUBTYPE_FACTORY, SUBTYPE_OTA_0 = 0x00, 0x10
+SUBTYPE_OTA_DATA, SUBTYPE_SPIFFS = 0x00, 0x82
+
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def read_partition_table(path):
+    """Return [(label, type, subtype, offset, size)] from a partition-table.bin."""
+    with open(path, "rb") as f:
+        data = f.read()
+    partitions = []
+    for pos in range(0, len(data) - PARTITION_ENTRY.size + 1, PARTITION_ENTRY.size):
+        magic, ptype, subtype, offset, size, label, _ = PARTITION_ENTRY.unpack_from(data, pos)
+        if magic != PARTITION_MAGIC:
+            break
+        partitions.append((label.rstrip(b"\0").decode("ascii", "replace"), ptype, subtype, offset, size))
+    return partitions
+
+
+def layout_for(artifacts, defaults):
+    """Map each artifact to its flash offset.
+
+    Offsets come from the cached partition table when it names a matching
+    partition, otherwise from `defaults` (the offsets the script used to pass
+    to esptool). Returns a sorted [(offset, artifact name)] list.
+    """
+    offsets = {"bootloader": BOOTLOADER_OFFSET, "partition_table": PARTITION_TABLE_OFFSET}
+    offsets.update(defaults)
+    if "partition_table" in artifacts:
+        apps = {}
+        for label, ptype, subtype, offset, size in read_partition_table(artifacts["partition_table"]):
+            if ptype == TYPE_APP and subtype in (SUBTYPE_FACTORY, SUBTYPE_OTA_0):
+                apps.setdefault(subtype, offset)
+            elif ptype == TYPE_DATA and subtype == SUBTYPE_OTA_DATA:
+                offsets["ota_data"] = offset
+            elif ptype == TYPE_DATA and subtype == SUBTYPE_SPIFFS:
+                offsets["spiffs"] = offset
+        if apps:
+            offsets["app"] = apps.get(SUBTYPE_FACTORY, apps.get(SUBTYPE_OTA_0))
+    return sorted((offsets[name], name) for name in artifacts if name in offsets)
+
+
+def _file_digest(path):
+    # Cached artifacts never change in place, so size + mtime is enough to
+    # skip re-reading them for every unit.
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            sha.update(block)
+    digest = sha.hexdigest()
+    with _digests_lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+
+def merge_key(artifacts, layout):
+    sha = hashlib.sha256()
+    sha.update(json.dumps(layout).encode("utf-8"))
+    for _, name in layout:
+        sha.update(_file_digest(artifacts[name]).encode("ascii"))
+    return sha.hexdigest()
+
+
+def split_layout(layout, sizes):
+    """Split a sorted [(offset, name)] layout into runs that can share one image.
+
+    Two artifacts go in the same run when the gap between them lies inside a
+    sector the first one already touches (it is erased anyway). A gap holding
+    a whole sector, e.g. NVS and phy_init between the partition table and the
+    app, starts a new run so that flash is left alone.
+    """
+    runs = []
+    end = None
+    for offset, name in layout:
+        if end is not None and offset < end:
+            raise RuntimeError(f"{name} at {offset:#x} overlaps the previous image (ends {end:#x}).")
+        if end is not None and offset <= -(-end // FLASH_SECTOR_SIZE) * FLASH_SECTOR_SIZE:
+            runs[-1].append((offset, name))
+        else:
+            runs.append([(offset, name)])
+        end = offset + sizes[name]
+    return runs
+
+
+def firmware_key(artifacts, defaults):
+    """Content key of everything flashed for `artifacts` (recorded with each unit)."""
+    return merge_key(artifacts, layout_for(artifacts, defaults))
+
+
+def merged_images(artifacts, defaults, log=print):
+    """Return [(offset, path)] of the merged images for `artifacts`, building each on first use.
+
+    One image per run of split_layout(); write each at its offset.
+    """
+    layout = layout_for(artifacts, defaults)
+    if not layout:
+        raise RuntimeError("No flashable artifacts to merge.")
+    runs = split_layout(layout, {name: os.path.getsize(artifacts[name]) for _, name in layout})
+    return [_merged_image(artifacts, run, log) for run in runs]
+
+
+def _merged_image(artifacts, layout, log):
+    key = merge_key(artifacts, layout)
+    base = layout[0][0]
+    path = os.path.join(MERGED_DIR, f"{key}.bin")
+    regions = [(offset, name, os.path.getsize(artifacts[name])) for offset, name in layout]
+    if os.path.exists(path):
+        if image_regions(path) is None:
+            write_regions(path, base, regions)
+        return base, path
+
+    os.makedirs(MERGED_DIR, exist_ok=True)
+    fd, staging = tempfile.mkstemp(prefix=".merge-", dir=MERGED_DIR)
+    with os.fdopen(fd, "wb") as out:
+        end = base
+        for offset, name in layout:
+            out.write(b"\xff" * (offset - end))
+            with open(artifacts[name], "rb") as f:
+                data = f.read()
+            out.write(data)
+            end = offset + len(data)
+    os.replace(staging, path)
+    write_regions(path, base, regions)
+    log(f"INFO: Merged {', '.join(f'{name}@{offset:#x}' for offset, name in layout)} into {os.path.basename(path)[:12]}")
+    return base, path
@@ -0,0 +1,66 @@
+#
+# flash_progress.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Live flash progress. In-process writes report per block, esptool
+#          subprocesses are read line by line as they run; both publish the
+#          same progress events (bytes, percent, effective kbit/s).
+# v1.0.1 - esptool output parsing removed; every tool flashes through DeviceSession
+#
+
+import time
+
+# Callbacks at most this often; the first and the last update always go out.
+PROGRESS_INTERVAL = 0.25
+
+
+def format_progress(event):
+    return (f"{event['percent']:3d}% ({event['bytes'] // 1024} of {event['total'] // 1024} KB) "
+            f"at {event['kbit_s']:.0f} kbit/s")
+
+
+class FlashProgress:
+    """Turns "so many bytes done" into progress events for one write.
+
+    Events are dicts: {"address", "bytes", "total", "percent", "kbit_s",
+    "elapsed"}. Throughput is in uncompressed bytes, the same "effective"
+    figure esptool prints.
+    """
+
+    def __init__(self, total, callback, address=0, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.callback = callback
+        self.address = address
+        self.interval = interval
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._last_sent = None
+
+    def advance(self, nbytes):
+        self.update(self.bytes + nbytes)
+
+    def update(self, done, address=None):
+        self.bytes = min(done, self.total) if self.total else done
+        if address is not None:
+            self.address = address
+        now = time.monotonic()
+        finished = self.total and self.bytes >= self.total
+        if self._last_sent is not None and not finished and now - self._last_sent < self.interval:
+            return
+        self._last_sent = now
+        self.callback(self.event(now))
+
+    def event(self, now=None):
+        elapsed = (now or time.monotonic()) - self.started
+        return {
+            "address": self.address,
+            "bytes": self.bytes,
+            "total": self.total,
+            "percent": int(self.bytes * 100 / self.total) if self.total else 0,
+            "kbit_s": self.bytes * 8 / 1000 / elapsed if elapsed > 0 else 0.0,
+            "elapsed": elapsed,
+        }
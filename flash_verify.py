@@ -0,0 +1,94 @@
+#
+# flash_verify.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Per-region flash verification. Digests of each region of a merged
+#          image (bootloader, partition table, app, ...) are computed once,
+#          through a memory map, and kept next to the image; every unit is
+#          then checked by asking the chip for the MD5 of each region.
+#
+# The ROM and stub loaders only hash flash with MD5, so the chip is checked
+# against MD5; the SHA-256 of each region is kept in the same file for QA.
+#
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+
+_regions = {}
+_regions_lock = threading.Lock()
+
+
+def regions_path(image_path):
+    return os.path.splitext(image_path)[0] + ".regions.json"
+
+
+def compute_regions(image_path, base, layout):
+    """Digest every (offset, name, size) of `layout` in the image at `image_path`.
+
+    `base` is the flash offset of the image's first byte. Returns
+    [{"name", "offset", "size", "md5", "sha256"}] in flash order.
+    """
+    regions = []
+    with open(image_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+        view = memoryview(image)
+        try:
+            for offset, name, size in layout:
+                data = view[offset - base:offset - base + size]
+                regions.append({"name": name, "offset": offset, "size": size,
+                                "md5": hashlib.md5(data).hexdigest(), "sha256": hashlib.sha256(data).hexdigest()})
+                data.release()
+        finally:
+            view.release()
+    return regions
+
+
+def write_regions(image_path, base, layout):
+    """Compute the region digests of `image_path` and store them beside it. Returns them."""
+    regions = compute_regions(image_path, base, layout)
+    directory = os.path.dirname(image_path) or "."
+    fd, staging = tempfile.mkstemp(prefix=".regions-", dir=directory)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"base": base, "regions": regions}, f, indent=2)
+    os.replace(staging, regions_path(image_path))
+    with _regions_lock:
+        _regions[image_path] = regions
+    return regions
+
+
+def image_regions(image_path):
+    """The stored region digests of a merged image, loaded once per process (None if never computed)."""
+    with _regions_lock:
+        if image_path in _regions:
+            return _regions[image_path]
+    try:
+        with open(regions_path(image_path)) as f:
+            regions = json.load(f)["regions"]
+    except (OSError, ValueError, KeyError):
+        return None
+    with _regions_lock:
+        _regions[image_path] = regions
+    return regions
+
+
+def verify_regions(session, regions, log=print):
+    """Compare the chip's MD5 of every region with `regions`. Raises listing the ones that differ."""
+    mismatched = []
+    for region in regions:
+        actual = session.flash_md5(region["offset"], region["size"])
+        if actual != region["md5"]:
+            mismatched.append(region)
+            log(f"ERROR: {region['name']} at {region['offset']:#x} ({region['size']} bytes): "
+                f"flash MD5 {actual} != {region['md5']}")
+    if mismatched:
+        raise RuntimeError(f"Flash verify failed for {', '.join(r['name'] for r in mismatched)}.")
+    log(f"SUCCESS: Verified {', '.join(r['name'] for r in regions)} "
+        f"({sum(r['size'] for r in regions)} bytes) against the build.")
+    return len(regions)
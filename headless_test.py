@@ -1,17 +1,19 @@
 # headless_test.py
-from factory_app import FactoryProvisioningApp
-import tkinter as tk
+# Runs the full provisioning workflow on one port with no GUI (no Tk, no DummyRoot).
+# For fixtures and scripting use factory_cli.py.
+import sys
 
-class DummyRoot:
-    def update_idletasks(self): pass
-    def title(self, x): pass
-    def geometry(self, x): pass
+from provisioning import ProvisioningWorkflow, DEFAULT_PORT
 
-app = FactoryProvisioningApp(DummyRoot())
 
-port = "/dev/cu.usbmodem101"  # or whatever your working port is
+def main():
+    port = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PORT  # or whatever your working port is
 
-print("Running provisioning workflow on:", port)
-app.log = print  # redirect log output to terminal
+    print("Running provisioning workflow on:", port)
+    result = ProvisioningWorkflow(log=print).run(port)
+    print(f"Result: {result['status']} {result.get('short_id') or result.get('error')}")
+    return 0 if result["status"] == "passed" else 1
 
-app.get_mac_address(port)
+
+if __name__ == "__main__":
+    sys.exit(main())
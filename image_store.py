@@ -0,0 +1,131 @@
+#
+# image_store.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Shared flash image store. Each merged image is memory-mapped once
+#          and deflated once per process (the compressed stream is kept on
+#          disk beside the image for the next process); every session writes
+#          from the same read-only data and pre-split compressed blocks.
+#
+
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+import zlib
+
+# Same level esptool uses for write_flash -z.
+COMPRESS_LEVEL = 9
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class FlashImage:
+    """One image file, mapped read-only. Safe to share between every port."""
+
+    def __init__(self, path):
+        self.path = path
+        self._stamp = self._stat()
+        self._mmap = _map(path)
+        self.data = memoryview(self._mmap)
+        self._lock = threading.Lock()
+        self._pad_lock = threading.Lock()
+        self._padded = {}
+        self._compressed = {}
+        self._blocks = {}
+        self._md5 = {}
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return st.st_size, st.st_mtime_ns
+
+    def is_current(self):
+        try:
+            return self._stat() == self._stamp
+        except OSError:
+            return False
+
+    def __len__(self):
+        return len(self.data)
+
+    def padded(self, alignment):
+        """The image 0xFF-padded to a multiple of `alignment`: the mapping itself when it already is."""
+        if len(self.data) % alignment == 0:
+            return self.data
+        with self._pad_lock:
+            if alignment not in self._padded:
+                self._padded[alignment] = bytes(self.data) + b"\xff" * (-len(self.data) % alignment)
+            return self._padded[alignment]
+
+    def md5(self, alignment=1):
+        """Hex MD5 of padded(alignment), computed once."""
+        with self._lock:
+            digest = self._md5.get(alignment)
+        if digest is None:
+            digest = hashlib.md5(self.padded(alignment)).hexdigest()
+            with self._lock:
+                self._md5[alignment] = digest
+        return digest
+
+    def compressed(self, alignment=4):
+        """Deflated padded(alignment), from the on-disk copy when an earlier run left one."""
+        # Held while deflating: the first unit compresses, the others wait for it.
+        with self._lock:
+            if alignment not in self._compressed:
+                self._compressed[alignment] = self._load_compressed(alignment)
+            return self._compressed[alignment]
+
+    def _load_compressed(self, alignment):
+        # Merged images are named by content, so a stream beside one always matches it.
+        path = f"{os.path.splitext(self.path)[0]}.a{alignment}.zlib"
+        if os.path.exists(path):
+            return memoryview(_map(path))
+        data = zlib.compress(self.padded(alignment), COMPRESS_LEVEL)
+        fd, staging = tempfile.mkstemp(prefix=".zlib-", dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(staging, path)
+        return memoryview(data)
+
+    def blocks(self, block_size, alignment=4):
+        """[(compressed block, uncompressed bytes it carries)] for flash_defl_block, split once per size."""
+        with self._lock:
+            cached = self._blocks.get((block_size, alignment))
+        if cached is not None:
+            return cached
+        compressed = self.compressed(alignment)
+        decompress = zlib.decompressobj()
+        blocks = []
+        for start in range(0, len(compressed), block_size):
+            block = bytes(compressed[start:start + block_size])
+            blocks.append((block, len(decompress.decompress(block))))
+        with self._lock:
+            self._blocks[(block_size, alignment)] = blocks
+        return blocks
+
+
+class ImageStore:
+    """FlashImage per path, opened on first use and reopened if the file is replaced."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._images = {}
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            image = self._images.get(path)
+            if image is None or not image.is_current():
+                image = self._images[path] = FlashImage(path)
+            return image
+
+
+image_store = ImageStore()
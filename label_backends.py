@@ -0,0 +1,194 @@
+#
+# label_backends.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.5
+#
+# v1.0.0 - Label backends. The PNG backend is the existing PIL label + lp;
+#          the ZPL backend sends a few hundred bytes of printer-native ZPL
+#          (QR and text rendered by the printer) to a file, a raw 9100 socket
+#          or a local spool directory.
+# v1.0.1 - No per-unit TXT next to the PNG; units are in the production DB
+# v1.0.2 - PIL/qrcode only imported once a PNG label is actually drawn
+# v1.0.3 - lp and printer sends are metrics.tracer spans
+# v1.0.4 - A failed ZPL send only warns (like lp) and keeps the job in a fallback directory for reprint
+# v1.0.5 - LabelBackend is an abstract base class; a backend without emit() fails when built
+#
+
+from abc import ABC, abstractmethod
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import time
+
+from metrics import tracer
+
+RAW_PRINT_PORT = 9100
+SOCKET_TIMEOUT = 5
+# 2" x 1.25" label at 203 dpi.
+ZPL_LABEL_WIDTH = 406
+ZPL_LABEL_LENGTH = 254
+# Version 4 QR is 33 modules; at 4 dots per module it is 132 dots wide.
+ZPL_QR_MAGNIFICATION = 4
+ZPL_QR_MODULES = 33
+ZPL_FONT_HEIGHT = 30
+
+
+class LabelBackend(ABC):
+    """Turns one unit into a label and sends it wherever labels go.
+
+    emit() returns {"label_path", "label_image"}; either may be None (a ZPL
+    label has no image, a socket has no path).
+    """
+
+    @abstractmethod
+    def emit(self, full_hash, short_id, unit_num, log=print):
+        """Produce and send the label for one unit."""
+
+
+class PngLabelBackend(LabelBackend):
+    """QR + short ID drawn with PIL, saved as PNG and sent to `lp` on macOS."""
+
+    def __init__(self, directory, renderer=None):
+        self.directory = directory
+        self.renderer = renderer
+
+    def emit(self, full_hash, short_id, unit_num, log=print):
+        if self.renderer is None:
+            # Imported here so the ZPL path and headless runs never load PIL.
+            from label_renderer import shared_renderer
+            self.renderer = shared_renderer()
+        image = self.renderer.render(full_hash, short_id)
+        base_path = os.path.join(self.directory, f"device_{unit_num}_{short_id}")
+        image.save(f"{base_path}.png")
+
+        if platform.system() == "Darwin":
+            try:
+                with tracer.span("print_lp"):
+                    subprocess.run(["lp", f"{base_path}.png"], check=True)
+                log(f"SUCCESS: Printed label: {base_path}.png")
+            except subprocess.CalledProcessError as e:
+                log(f"WARNING: Print failed: {e}")
+        else:
+            log("INFO: Auto-printing only supported on macOS")
+        return {"label_path": f"{base_path}.png", "label_image": image}
+
+
+def _zpl_field(text):
+    # ^ and ~ start ZPL commands; nothing in a short ID needs them.
+    return str(text).replace("^", "").replace("~", "")
+
+
+def zpl_label(full_hash, short_id, width=ZPL_LABEL_WIDTH, length=ZPL_LABEL_LENGTH,
+              magnification=ZPL_QR_MAGNIFICATION):
+    """ZPL II for one label: the hash as a QR code (ECC L) with the short ID centred below."""
+    qr_width = ZPL_QR_MODULES * magnification
+    qr_x = (width - qr_width) // 2
+    text_y = 10 + qr_width + 20
+    return (
+        "^XA\n"
+        "^CI28\n"
+        f"^PW{width}\n"
+        f"^LL{length}\n"
+        f"^FO{qr_x},10^BQN,2,{magnification}^FDLA,{_zpl_field(full_hash)}^FS\n"
+        f"^FO0,{text_y}^FB{width},1,0,C^A0N,{ZPL_FONT_HEIGHT},{ZPL_FONT_HEIGHT}^FD{_zpl_field(short_id)}^FS\n"
+        "^XZ\n"
+    )
+
+
+class FileSink:
+    """Writes each job to <directory>/<name>.zpl."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}.zpl")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+class SocketSink:
+    """Raw TCP (JetDirect, port 9100): the printer takes ZPL as-is, no spooler involved."""
+
+    def __init__(self, host, port=RAW_PRINT_PORT, timeout=SOCKET_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, name, data):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as conn:
+            conn.sendall(data)
+        return f"{self.host}:{self.port}"
+
+
+class SpoolSink:
+    """Local stand-in for a print queue: jobs appear atomically in `directory`.
+
+    A job file is only ever seen complete, so a spooler (or a test) can pick
+    up *.zpl in name order and delete what it has printed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def send(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".job-", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = os.path.join(self.directory, f"{time.time_ns()}_{name}.zpl")
+        os.replace(tmp, path)
+        return path
+
+
+class ZplLabelBackend(LabelBackend):
+    """Printer-native labels: no rasterizing, a few hundred bytes per unit.
+
+    A send that fails (printer off, wrong address, timeout) does not fail the
+    unit. The job is written to `fallback_dir`, if given, so it can be
+    reprinted from there.
+    """
+
+    def __init__(self, sink, fallback_dir=None):
+        self.sink = sink
+        self.fallback = FileSink(fallback_dir) if fallback_dir else None
+
+    def emit(self, full_hash, short_id, unit_num, log=print):
+        name = f"device_{unit_num}_{short_id}"
+        data = zpl_label(full_hash, short_id).encode("utf-8")
+        try:
+            with tracer.span("print_zpl", sink=type(self.sink).__name__):
+                target = self.sink.send(name, data)
+        except OSError as e:
+            log(f"WARNING: Print failed: {e}")
+            return {"label_path": self._keep(name, data, log), "label_image": None}
+        log(f"SUCCESS: Sent {len(data)} byte ZPL label to {target}")
+        return {"label_path": None if isinstance(self.sink, SocketSink) else target, "label_image": None}
+
+    def _keep(self, name, data, log):
+        if self.fallback is None or self.fallback.directory == getattr(self.sink, "directory", None):
+            return None
+        try:
+            path = self.fallback.send(name, data)
+        except OSError as e:
+            log(f"WARNING: Could not keep the label for reprint: {e}")
+            return None
+        log(f"INFO: Label kept for reprint: {path}")
+        return path
+
+
+def make_sink(target):
+    """"tcp://host[:port]" -> SocketSink, "spool:<dir>" -> SpoolSink, anything else is a directory."""
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].partition(":")
+        return SocketSink(host, int(port) if port else RAW_PRINT_PORT)
+    if target.startswith("spool:"):
+        return SpoolSink(target[len("spool:"):])
+    return FileSink(target)
@@ -0,0 +1,121 @@
+#
+# label_renderer.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Label rendering with everything that does not depend on the unit
+#          prepared once: fonts, the QR encoder (fixed version and mask for a
+#          64-hex SHA-256) and a blank template canvas.
+# v1.0.1 - shared_renderer(): one process-wide instance, created on first use
+#
+
+import threading
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+# A lowercase hex SHA-256 is 64 bytes in byte mode, which fits version 4 at
+# error correction L. Fixing the version skips best_fit() and fixing the mask
+# skips scoring all eight patterns on every label.
+QR_VERSION = 4
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_L
+QR_MASK_PATTERN = 0
+QR_PAYLOAD_LENGTH = 64
+BOX_SIZE = 4
+BORDER = 2
+FONT_SIZE = 16
+TEXT_MARGIN = 5
+# First one that loads wins; PIL's built-in bitmap font otherwise.
+FONT_CANDIDATES = ("arial.ttf", "Arial.ttf", "/Library/Fonts/Arial.ttf", "DejaVuSans.ttf",
+                   "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def load_font(size=FONT_SIZE):
+    """Cached label font. The lookup (and any fallback) happens once per size."""
+    with _fonts_lock:
+        if size not in _fonts:
+            font = None
+            for candidate in FONT_CANDIDATES:
+                try:
+                    font = ImageFont.truetype(candidate, size)
+                    break
+                except OSError:
+                    continue
+            _fonts[size] = font or ImageFont.load_default()
+        return _fonts[size]
+
+
+def shared_renderer():
+    """The process-wide renderer, so fonts and the QR encoder are set up once."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LabelRenderer()
+        return _shared
+
+
+class LabelRenderer:
+    """QR code with the short ID centred underneath, as an RGB image.
+
+    One instance is meant to live for the whole session; render() is safe to
+    call from several threads.
+    """
+
+    def __init__(self, box_size=BOX_SIZE, border=BORDER, font_size=FONT_SIZE):
+        self.box_size = box_size
+        self.border = border
+        self.font = load_font(font_size)
+        self._lock = threading.Lock()
+        self._qr = qrcode.QRCode(version=QR_VERSION, error_correction=QR_ERROR_CORRECTION,
+                                 box_size=box_size, border=border, mask_pattern=QR_MASK_PATTERN)
+        self.qr_size = (self._qr.modules_count + 2 * border) * box_size
+        # Every short ID ("ABCD-1234") has the same height, so the canvas does too.
+        probe = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+        bbox = probe.textbbox((0, 0), "ABCD-1234", font=self.font)
+        self.text_height = bbox[3] - bbox[1]
+        self._template = Image.new("RGB", (self.qr_size, self.qr_size + self.text_height + 2 * TEXT_MARGIN), "white")
+
+    def _matrix(self, data):
+        qr = self._qr
+        if len(data) > QR_PAYLOAD_LENGTH:
+            # Not a device hash; let qrcode pick whatever version it needs.
+            qr = qrcode.QRCode(error_correction=QR_ERROR_CORRECTION, box_size=self.box_size, border=self.border)
+            qr.add_data(data)
+            qr.make(fit=True)
+            return qr.get_matrix()
+        qr.clear()
+        qr.add_data(data)
+        qr.make(fit=False)
+        return qr.get_matrix()
+
+    def qr_image(self, data):
+        """Just the QR code, box_size pixels per module, border included."""
+        with self._lock:
+            matrix = self._matrix(data)
+        modules = len(matrix)
+        # One byte per module, then a nearest-neighbour scale: far cheaper than
+        # drawing box_size x box_size rectangles module by module.
+        pixels = bytes(0 if dark else 255 for row in matrix for dark in row)
+        small = Image.frombytes("L", (modules, modules), pixels)
+        return small.resize((modules * self.box_size,) * 2, Image.NEAREST).convert("RGB")
+
+    def render(self, data, text):
+        qr = self.qr_image(data)
+        if qr.width != self.qr_size:
+            canvas = Image.new("RGB", (qr.width, qr.height + self.text_height + 2 * TEXT_MARGIN), "white")
+        else:
+            canvas = self._template.copy()
+        canvas.paste(qr, (0, 0))
+        draw = ImageDraw.Draw(canvas)
+        bbox = draw.textbbox((0, 0), text, font=self.font)
+        draw.text(((canvas.width - (bbox[2] - bbox[0])) / 2, qr.height + TEXT_MARGIN), text,
+                  fill="black", font=self.font)
+        return canvas
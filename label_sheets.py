@@ -0,0 +1,132 @@
+#
+# label_sheets.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.2
+#
+# v1.0.0 - Batch labels: lay a production lot out on sheet or roll pages, save
+#          it as one multi-page PDF plus a CSV index, and print it with one
+#          CUPS job per sheet instead of one per unit.
+# v1.0.1 - Uses the process-wide renderer by default
+# v1.0.2 - Numeric unit order (1000 after 999)
+#
+
+import csv
+import os
+import platform
+import subprocess
+import time
+
+from PIL import Image
+
+from label_renderer import shared_renderer
+
+
+class SheetLayout:
+    """Grid of equal label cells on a page, all sizes in pixels at `dpi`."""
+
+    def __init__(self, name, page_size, columns, rows, dpi=200, margin=50, gap=20):
+        self.name = name
+        self.page_size = page_size
+        self.columns = columns
+        self.rows = rows
+        self.dpi = dpi
+        self.margin = margin
+        self.gap = gap
+
+    @property
+    def per_sheet(self):
+        return self.columns * self.rows
+
+    def cell_size(self):
+        width, height = self.page_size
+        return ((width - 2 * self.margin - (self.columns - 1) * self.gap) // self.columns,
+                (height - 2 * self.margin - (self.rows - 1) * self.gap) // self.rows)
+
+    def position(self, index):
+        """Top-left corner of cell `index` (row-major) on its sheet."""
+        cell_w, cell_h = self.cell_size()
+        row, column = divmod(index % self.per_sheet, self.columns)
+        return (self.margin + column * (cell_w + self.gap), self.margin + row * (cell_h + self.gap))
+
+
+# US Letter at 200 dpi, 8 x 10 labels; and a 2" wide roll cut every 10 labels.
+LETTER = SheetLayout("letter", (1700, 2200), columns=8, rows=10)
+ROLL = SheetLayout("roll", (400, 2000), columns=1, rows=10, margin=10, gap=10)
+LAYOUTS = {layout.name: layout for layout in (LETTER, ROLL)}
+
+
+def labels_from_results(results):
+    """(unit_num, short_id, device_id) for every passed unit, in unit order."""
+    lot = [(r.get("unit_num") or "", r["short_id"], r["device_id"])
+           for r in results if r.get("status") == "passed" and r.get("device_id")]
+    # Unit numbers are zero-padded to three digits only.
+    return sorted(lot, key=lambda label: (int(label[0]) if label[0].isdigit() else -1, label))
+
+
+def render_sheets(labels, layout=LETTER, renderer=None):
+    """Page images for `labels` ([(unit_num, short_id, device_id)]), `per_sheet` labels a page."""
+    renderer = renderer or shared_renderer()
+    cell_w, cell_h = layout.cell_size()
+    pages = []
+    for index, (_, short_id, device_id) in enumerate(labels):
+        if index % layout.per_sheet == 0:
+            pages.append(Image.new("RGB", layout.page_size, "white"))
+        label = renderer.render(device_id, short_id)
+        if label.width > cell_w or label.height > cell_h:
+            label.thumbnail((cell_w, cell_h), Image.NEAREST)
+        x, y = layout.position(index)
+        # Centred in its cell.
+        pages[-1].paste(label, (x + (cell_w - label.width) // 2, y + (cell_h - label.height) // 2))
+    return pages
+
+
+def write_lot(labels, directory, layout=LETTER, renderer=None, name=None):
+    """Render `labels` to <name>.pdf (one page per sheet) and <name>.csv.
+
+    Returns (pdf_path, sheet_count).
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = name or time.strftime("lot_%Y%m%d_%H%M%S")
+    base_path = os.path.join(directory, name)
+    pages = render_sheets(labels, layout, renderer)
+    if not pages:
+        return None, 0
+    pages[0].save(f"{base_path}.pdf", save_all=True, append_images=pages[1:], resolution=layout.dpi)
+    with open(f"{base_path}.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["sheet", "unit_num", "short_id", "mac_hash"])
+        for index, (unit_num, short_id, device_id) in enumerate(labels):
+            writer.writerow([index // layout.per_sheet + 1, unit_num, short_id, device_id])
+    return f"{base_path}.pdf", len(pages)
+
+
+def print_sheets(pdf_path, sheet_count, log=print):
+    """Submit each page of `pdf_path` as its own print job. Returns how many were queued."""
+    if platform.system() != "Darwin":
+        log("INFO: Auto-printing only supported on macOS")
+        return 0
+    queued = 0
+    for sheet in range(1, sheet_count + 1):
+        try:
+            subprocess.run(["lp", "-P", str(sheet), pdf_path], check=True)
+            queued += 1
+        except subprocess.CalledProcessError as e:
+            log(f"WARNING: Print failed for sheet {sheet} of {pdf_path}: {e}")
+    log(f"SUCCESS: Queued {queued} of {sheet_count} sheet(s) from {pdf_path}")
+    return queued
+
+
+def print_lot(results, directory, layout=LETTER, renderer=None, log=print, print_pages=True):
+    """Render every passed unit in `results` as one lot and print it sheet by sheet."""
+    labels = labels_from_results(results)
+    if not labels:
+        log("INFO: No passed units to print.")
+        return None
+    pdf_path, sheets = write_lot(labels, directory, layout, renderer)
+    log(f"SUCCESS: {len(labels)} label(s) on {sheets} {layout.name} sheet(s): {pdf_path}")
+    if print_pages:
+        print_sheets(pdf_path, sheets, log=log)
+    return pdf_path
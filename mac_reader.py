@@ -0,0 +1,41 @@
+#
+# mac_reader.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Read only the factory MAC (two eFuse registers) instead of dumping
+#          and regex-scanning the whole espefuse.py summary, and hand it back
+#          in one canonical format for every tool.
+# v1.0.1 - read_mac(port) removed; every tool reads the MAC from its DeviceSession
+#
+
+import re
+
+_HEX_DIGITS = re.compile(r"[^0-9a-fA-F]")
+
+
+def normalize_mac(value):
+    """Canonical MAC: lowercase, colon separated ("7c:df:a1:00:11:22").
+
+    Accepts the tuple esptool's read_mac() returns, raw bytes, or any string
+    spelling ("7CDFA1001122", "7c-df-a1-00-11-22", "7c:df:a1:00:11:22 (OK)").
+    """
+    if isinstance(value, (tuple, list, bytes, bytearray)):
+        octets = bytes(value)
+    else:
+        digits = _HEX_DIGITS.sub("", str(value).split("(")[0])
+        if len(digits) != 12:
+            raise ValueError(f"Not a MAC address: {value!r}")
+        octets = bytes.fromhex(digits)
+    if len(octets) != 6:
+        raise ValueError(f"Not a MAC address: {value!r}")
+    return ":".join(f"{b:02x}" for b in octets)
+
+
+def read_factory_mac(esp):
+    """Factory (base) MAC from an already-synced esptool loader; two register reads."""
+    return normalize_mac(esp.read_mac("BASE_MAC"))
+
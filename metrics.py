@@ -0,0 +1,168 @@
+#
+# metrics.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Timing spans for every workflow step and external call: monotonic
+#          durations with unit trace ID, port and outcome, appended to a JSONL
+#          log and rolled up into a Prometheus text file (and, optionally, a
+#          local /metrics endpoint).
+# v1.0.1 - metrics.prom is world-readable (mkstemp files are 0600) for a
+#          node_exporter running as another user
+#
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SPANS_FILE = os.path.join(".factory_state", "spans.jsonl")
+METRICS_FILE = os.path.join(".factory_state", "metrics.prom")
+METRICS_FILE_MODE = 0o644
+# The .prom file is rewritten at most this often (and on flush()).
+METRICS_INTERVAL = 5.0
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Span attributes that become Prometheus labels; the rest only go to the JSONL.
+LABELS = ("port",)
+
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._start = time.monotonic()
+        self.duration = None
+
+    def end(self, outcome="ok", **attrs):
+        if self.duration is None:
+            self.duration = time.monotonic() - self._start
+            self.attrs.update(attrs)
+            self.tracer._finish(self, outcome)
+        return self.duration
+
+
+class Tracer:
+    """Records spans. Safe to share between every port and background thread.
+
+        with tracer.span("http_post", path=path) as span:
+            ...
+            span.attrs["status"] = response.status_code
+
+    or span = tracer.start(...); ...; span.end("error", error="...").
+    """
+
+    def __init__(self, spans_path=SPANS_FILE, metrics_path=METRICS_FILE, interval=METRICS_INTERVAL):
+        self.spans_path = spans_path
+        self.metrics_path = metrics_path
+        self.interval = interval
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._file = None
+        self._histograms = {}
+        self._written_at = 0.0
+
+    def start(self, name, **attrs):
+        return Span(self, name, attrs)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = self.start(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.end("error", error=f"{type(e).__name__}: {e}")
+            raise
+        span.end(span.attrs.pop("outcome", "ok"))
+
+    def _finish(self, span, outcome):
+        if not self.enabled:
+            return
+        record = {"name": span.name, "outcome": outcome, "started_at": round(span.started_at, 6),
+                  "duration_s": round(span.duration, 6)}
+        record.update((k, v) for k, v in span.attrs.items() if v is not None)
+        line = json.dumps(record, default=str)
+        key = (span.name, outcome) + tuple(str(span.attrs.get(label) or "") for label in LABELS)
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.spans_path) or ".", exist_ok=True)
+                self._file = open(self.spans_path, "a", buffering=1)
+            self._file.write(line + "\n")
+            counts, total = self._histograms.get(key, ([0] * (len(BUCKETS) + 1), 0.0))
+            for i, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._histograms[key] = (counts, total + span.duration)
+            due = time.monotonic() - self._written_at >= self.interval
+        if due:
+            self.write_metrics()
+
+    def prometheus_text(self):
+        with self._lock:
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+        lines = ["# HELP pianoguard_span_duration_seconds Duration of provisioning steps and external calls.",
+                 "# TYPE pianoguard_span_duration_seconds histogram"]
+        for key in sorted(histograms):
+            counts, total = histograms[key]
+            name, outcome, *values = key
+            labels = f'span="{name}",outcome="{outcome}"' + "".join(
+                f',{label}="{value}"' for label, value in zip(LABELS, values))
+            for bound, count in zip(BUCKETS, counts):
+                lines.append(f'pianoguard_span_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'pianoguard_span_duration_seconds_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+            lines.append(f"pianoguard_span_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"pianoguard_span_duration_seconds_count{{{labels}}} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        """Atomically replace the .prom file (node_exporter textfile collector format)."""
+        text = self.prometheus_text()
+        directory = os.path.dirname(self.metrics_path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".metrics-", dir=directory)
+        # mkstemp creates 0600; the collector usually runs as another user.
+        os.fchmod(fd, METRICS_FILE_MODE)
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, self.metrics_path)
+        self._written_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._file:
+                self._file.flush()
+        self.write_metrics()
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve GET /metrics on a daemon thread. Returns the server."""
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+tracer = Tracer()
@@ -0,0 +1,258 @@
+#
+# outbox.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.3
+#
+# v1.0.0 - Durable registration outbox. Each provisioned mac_hash is journaled
+#          to SQLite and a background flusher submits the records in batches
+#          with idempotency keys, so a slow or down backend never stalls flashing.
+# v1.0.1 - Each flush is a metrics.tracer span
+# v1.0.2 - Only explicit validation errors (400/422) reject a record; 404, 5xx and
+#          connection errors stay pending. A missing batch endpoint is re-tried later.
+# v1.0.3 - on_settled callback with each record that ends registered or rejected
+#
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from metrics import tracer
+
+OUTBOX_DB = os.path.join(".factory_state", "registration_outbox.db")
+PROVISION_PATH = "/api/factory/provision"
+BATCH_PATH = "/api/factory/provision/batch"
+BATCH_SIZE = 50
+# The backend looked at the record and refused it. Anything else (404 from a
+# half-deployed backend, 5xx, auth, rate limits) keeps it pending with backoff.
+REJECT_STATUS = (400, 422)
+# Per-record results in a batch response that mean the same.
+REJECT_RESULTS = ("invalid", "rejected")
+# After a 404/405 from the batch endpoint, post one by one for this long, then ask again.
+BATCH_RECHECK_INTERVAL = 600.0
+FLUSH_INTERVAL = 2.0
+RETRY_MAX_DELAY = 300.0
+
+PENDING = "pending"
+REGISTERED = "registered"
+REJECTED = "rejected"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    mac_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_mac_hash ON outbox (mac_hash);
+"""
+
+
+def idempotency_key(mac_hash):
+    # One key per device: re-queuing the same MAC (rework, retry after a
+    # crash) is the same registration as far as the backend is concerned.
+    return f"provision-{mac_hash}"
+
+
+class RegistrationOutbox:
+    """SQLite journal of registrations plus the thread that drains it.
+
+    The backend is asked for BATCH_PATH first. If that returns 404 or 405
+    (not deployed yet), the flusher falls back to one POST per record on
+    PROVISION_PATH, still carrying the Idempotency-Key header, and tries
+    the batch endpoint again after BATCH_RECHECK_INTERVAL.
+
+    A record is only marked rejected on an explicit validation error;
+    everything else is retried with backoff until it registers.
+
+    on_settled([(mac_hash, status)]) is called on the flusher thread after
+    each flush that registered or rejected something.
+    """
+
+    def __init__(self, client, path=OUTBOX_DB, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL, log=print,
+                 on_settled=None):
+        self.client = client
+        self.on_settled = on_settled
+        self.path = path
+        self.batch_size = batch_size
+        self.interval = interval
+        self.log = log
+        self._batch_retry_at = 0.0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+
+    @property
+    def batch_supported(self):
+        return time.time() >= self._batch_retry_at
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _db(self):
+        db = self._connect()
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def enqueue(self, mac_hash, **extra):
+        """Journal a registration and wake the flusher. Returns its idempotency key."""
+        key = idempotency_key(mac_hash)
+        now = time.time()
+        payload = json.dumps(dict(extra, mac_hash=mac_hash))
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO outbox (idempotency_key, mac_hash, payload, created_at, updated_at, next_attempt_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (idempotency_key) DO UPDATE SET status = 'pending', payload = excluded.payload, "
+                "updated_at = excluded.updated_at, next_attempt_at = excluded.next_attempt_at "
+                "WHERE status = 'rejected'", (key, mac_hash, payload, now, now, now))
+        self._wake.set()
+        return key
+
+    def status(self, mac_hash):
+        with self._db() as db:
+            row = db.execute("SELECT status FROM outbox WHERE mac_hash = ? ORDER BY id DESC LIMIT 1",
+                             (mac_hash,)).fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        with self._db() as db:
+            rows = db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {PENDING: 0, REGISTERED: 0, REJECTED: 0, **dict(rows)}
+
+    def _due(self):
+        with self._db() as db:
+            return db.execute(
+                "SELECT id, idempotency_key, payload, attempts FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (PENDING, time.time(), self.batch_size)).fetchall()
+
+    def _mark(self, updates):
+        """updates: [(id, status, error)]; failed records get a backoff delay."""
+        now = time.time()
+        with self._db() as db:
+            for record_id, status, error in updates:
+                if status == PENDING:
+                    attempts = db.execute("SELECT attempts FROM outbox WHERE id = ?", (record_id,)).fetchone()[0] + 1
+                    delay = random.uniform(0, min(RETRY_MAX_DELAY, 2 ** attempts))
+                    db.execute("UPDATE outbox SET attempts = ?, last_error = ?, updated_at = ?, next_attempt_at = ? "
+                               "WHERE id = ?", (attempts, error, now, now + delay, record_id))
+                else:
+                    db.execute("UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?, updated_at = ? "
+                               "WHERE id = ?", (status, error, now, record_id))
+
+    def _submit_batch(self, rows):
+        items = [dict(json.loads(payload), idempotency_key=key) for _, key, payload, _ in rows]
+        response = self.client.post(BATCH_PATH, {"devices": items}, log=self.log)
+        if response.status_code in (404, 405):
+            self.log(f"INFO: Batch registration endpoint not available, registering one by one "
+                     f"for the next {BATCH_RECHECK_INTERVAL:.0f} s.")
+            self._batch_retry_at = time.time() + BATCH_RECHECK_INTERVAL
+            return self._submit_each(rows)
+        if response.status_code >= 400:
+            return [(record_id, PENDING, f"batch HTTP {response.status_code}") for record_id, _, _, _ in rows]
+
+        # Reconcile per record; anything the server did not mention stays pending.
+        results = {r.get("idempotency_key"): r for r in response.json().get("results", [])}
+        updates = []
+        for record_id, key, _, _ in rows:
+            result = results.get(key)
+            if result is None:
+                updates.append((record_id, PENDING, "missing from batch response"))
+            elif result.get("status") in ("ok", "created", "duplicate"):
+                updates.append((record_id, REGISTERED, None))
+            elif result.get("status") in REJECT_RESULTS:
+                updates.append((record_id, REJECTED, result.get("message") or result.get("status")))
+            else:
+                updates.append((record_id, PENDING, result.get("message") or result.get("status")))
+        return updates
+
+    def _submit_each(self, rows):
+        updates = []
+        for record_id, key, payload, _ in rows:
+            try:
+                response = self.client.post(PROVISION_PATH, json.loads(payload), log=self.log,
+                                            headers={"Idempotency-Key": key})
+            except requests.RequestException as e:
+                updates.append((record_id, PENDING, str(e)))
+                continue
+            if response.ok or response.status_code == 409:
+                updates.append((record_id, REGISTERED, None))
+            elif response.status_code in REJECT_STATUS:
+                updates.append((record_id, REJECTED, f"HTTP {response.status_code}: {response.text[:200]}"))
+            else:
+                updates.append((record_id, PENDING, f"HTTP {response.status_code}"))
+        return updates
+
+    def flush_once(self):
+        """Submit one batch of due records. Returns how many were attempted."""
+        rows = self._due()
+        if not rows:
+            return 0
+        span = tracer.start("outbox_flush", records=len(rows), batch=self.batch_supported)
+        try:
+            updates = self._submit_batch(rows) if self.batch_supported else self._submit_each(rows)
+        except requests.RequestException as e:
+            updates = [(record_id, PENDING, str(e)) for record_id, _, _, _ in rows]
+        self._mark(updates)
+        if self.on_settled:
+            mac_hashes = {record_id: json.loads(payload)["mac_hash"] for record_id, _, payload, _ in rows}
+            settled = [(mac_hashes[record_id], status) for record_id, status, _ in updates if status != PENDING]
+            if settled:
+                try:
+                    self.on_settled(settled)
+                except Exception as e:
+                    self.log(f"WARNING: Outbox on_settled failed: {e}")
+        registered = sum(1 for _, status, _ in updates if status == REGISTERED)
+        span.end("ok" if registered == len(rows) else "partial", registered=registered)
+        self.log(f"INFO: Outbox flushed {len(rows)} record(s): {registered} registered.")
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.flush_once() == self.batch_size:
+                    continue
+            except Exception as e:
+                self.log(f"WARNING: Outbox flush failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="outbox-flusher", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
@@ -0,0 +1,229 @@
+#
+# port_watcher.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.2
+#
+# v1.0.0 - USB hot-plug discovery: finds ESP32-S3 boards by VID/PID/serial
+#          number as they are plugged in, so a fixture starts provisioning on
+#          arrival instead of waiting for someone to type its port.
+# v1.0.1 - forget_port(): a board whose unit failed is started again when replugged
+# v1.0.2 - mark_failed() instead: a failed board is only retried after it has really
+#          been unplugged, not when the session's reset re-enumerates it
+#
+# Enumeration is pyserial's list_ports (installed with esptool) on every
+# platform. On Linux, pyudev (optional) wakes the watcher on each tty add /
+# remove event; without it, or on macOS, the port list is polled.
+#
+
+import os
+import platform
+import threading
+import time
+
+from serial.tools import list_ports
+
+ESPRESSIF_VID = 0x303A
+# The S3's built-in USB-Serial/JTAG. Its USB serial number is the chip's MAC,
+# so it identifies the board, not the fixture.
+ESP32_S3_USB_JTAG = (ESPRESSIF_VID, 0x1001)
+DEFAULT_USB_IDS = (ESP32_S3_USB_JTAG,)
+POLL_INTERVAL = 0.5
+# With udev events the poll is only a safety net.
+UDEV_POLL_INTERVAL = 5.0
+# A new port has to stay put this long before it is reported (CDC enumeration,
+# a board pushed in at an angle).
+SETTLE_TIME = 0.3
+# A board back within this long of leaving was reset (re-enumeration takes
+# well under a second), not unplugged and plugged in again.
+REPLUG_GRACE = 2.0
+
+
+def parse_usb_ids(spec):
+    """"303a:1001,10c4:ea60" -> ((0x303a, 0x1001), (0x10c4, 0xea60))."""
+    ids = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        vid, _, pid = item.partition(":")
+        ids.append((int(vid, 16), int(pid, 16)))
+    return tuple(ids)
+
+
+# Extra IDs, e.g. the USB-UART bridge on a fixture: PIANOGUARD_USB_IDS="10c4:ea60".
+USB_IDS = DEFAULT_USB_IDS + parse_usb_ids(os.environ.get("PIANOGUARD_USB_IDS", ""))
+
+
+class UsbPort:
+    """One matching USB-serial device as list_ports reports it."""
+
+    def __init__(self, device, vid, pid, serial_number=None, location=None, description=None):
+        self.device = device
+        self.vid = vid
+        self.pid = pid
+        self.serial_number = serial_number
+        self.location = location
+        self.description = description
+
+    @property
+    def board_serial(self):
+        """The board's own serial (its MAC for the S3 USB-Serial/JTAG), None for bridges."""
+        return self.serial_number if (self.vid, self.pid) == ESP32_S3_USB_JTAG else None
+
+    def __repr__(self):
+        serial = f" {self.serial_number}" if self.serial_number else ""
+        return f"{self.device} [{self.vid:04x}:{self.pid:04x}{serial}]"
+
+
+def scan(ids=USB_IDS):
+    """Every connected USB-serial device whose VID/PID is in `ids`, by device path."""
+    ports = {}
+    for info in list_ports.comports():
+        if (info.vid, info.pid) in ids:
+            ports[info.device] = UsbPort(info.device, info.vid, info.pid, info.serial_number,
+                                         info.location, info.description)
+    return ports
+
+
+class PortWatcher:
+    """Calls on_arrival(UsbPort) for each board plugged in, on_departure(UsbPort) when it goes.
+
+    An S3 re-enumerates when the fixture stage resets it; a board whose serial
+    number has already been reported is not reported again until forget().
+    Call mark_failed() when the unit on a port fails: that board is reported
+    again once it comes back after being away for at least `replug_grace`,
+    i.e. after a real unplug, never after the reset that ends its session.
+    Callbacks run on the watcher thread.
+    """
+
+    def __init__(self, on_arrival, on_departure=None, ids=USB_IDS, interval=POLL_INTERVAL,
+                 settle=SETTLE_TIME, replug_grace=REPLUG_GRACE, log=print):
+        self.on_arrival = on_arrival
+        self.on_departure = on_departure
+        self.ids = ids
+        self.interval = interval
+        self.settle = settle
+        self.replug_grace = replug_grace
+        self.log = log
+        self._present = {}
+        self._pending = {}
+        self._reported = set()
+        # Board serial last reported on each device path.
+        self._serials = {}
+        self._failed = set()
+        # Serial -> when it was last seen leaving.
+        self._departed = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._monitor = None
+
+    def start(self, existing=False):
+        """Start watching. Boards already plugged in are reported only if `existing`."""
+        if not existing:
+            self._present = scan(self.ids)
+            with self._lock:
+                self._reported.update(p.board_serial for p in self._present.values() if p.board_serial)
+        self._stop.clear()
+        self._start_udev()
+        self._thread = threading.Thread(target=self._run, name="port-watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._monitor:
+            self._monitor.stop()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def forget(self, serial_number):
+        """Report this board again the next time it is plugged in (rework)."""
+        with self._lock:
+            self._reported.discard(serial_number)
+            self._failed.discard(serial_number)
+
+    def mark_failed(self, device):
+        """The unit on `device` failed: report its board again after it is unplugged and put back."""
+        with self._lock:
+            serial = self._serials.get(device)
+            if serial:
+                self._failed.add(serial)
+
+    def present(self):
+        return list(self._present.values())
+
+    def _start_udev(self):
+        if platform.system() != "Linux":
+            return
+        try:
+            import pyudev
+        except ImportError:
+            return
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by("tty")
+            self._monitor = pyudev.MonitorObserver(monitor, callback=lambda device: self._wake.set(),
+                                                   name="port-watcher-udev")
+            self._monitor.start()
+        except Exception as e:
+            self.log(f"WARNING: udev monitor unavailable ({e}), polling for USB ports.")
+            self._monitor = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.log(f"WARNING: USB port scan failed: {e}")
+            # Re-check soon while a new port is settling.
+            if self._pending:
+                timeout = self.settle
+            else:
+                timeout = UDEV_POLL_INTERVAL if self._monitor else self.interval
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def poll(self, now=None):
+        """One scan: report settled arrivals and departures. Returns the arrivals."""
+        now = now if now is not None else time.monotonic()
+        current = scan(self.ids)
+        for device in list(self._present):
+            if device not in current:
+                port = self._present.pop(device)
+                if port.board_serial:
+                    with self._lock:
+                        self._departed[port.board_serial] = now
+                if self.on_departure:
+                    self.on_departure(port)
+        for device in list(self._pending):
+            if device not in current:
+                del self._pending[device]
+
+        arrived = []
+        for device, port in current.items():
+            if device in self._present:
+                continue
+            first_seen = self._pending.setdefault(device, now)
+            if now - first_seen < self.settle:
+                continue
+            del self._pending[device]
+            self._present[device] = port
+            with self._lock:
+                serial = port.board_serial
+                if serial in self._failed and now - self._departed.get(serial, now) >= self.replug_grace:
+                    # Away longer than a reset takes: put back for another try.
+                    self._failed.discard(serial)
+                    self._reported.discard(serial)
+                repeat = serial in self._reported
+                if port.board_serial:
+                    self._reported.add(port.board_serial)
+                    self._serials[device] = port.board_serial
+            if repeat:
+                # Reset after flashing, or the same board put back: not a new unit.
+                continue
+            arrived.append(port)
+            self.on_arrival(port)
+        return arrived
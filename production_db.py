@@ -0,0 +1,246 @@
+#
+# production_db.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.3
+#
+# v1.0.0 - Production record of every unit in SQLite (WAL), indexed on MAC,
+#          mac_hash, short_id and lot, replacing the loose device_NNN_*.txt
+#          files in labels/. Bulk export to CSV or JSON lines.
+# v1.0.1 - set_registration() for the outbox flusher; export can sync from the outbox first
+# v1.0.2 - lot() in numeric unit order
+# v1.0.3 - A new database first imports the labels/device_NNN_<ID>.txt records
+#          written before it existed, so earlier units count as provisioned
+#
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+PRODUCTION_DB = os.path.join(".factory_state", "production.db")
+EXPORT_BATCH = 1000
+# Where the pre-database tools left one device_NNN_<short ID>.txt per unit.
+LEGACY_LABEL_DIR = "labels"
+LEGACY_LABEL_RE = re.compile(r"device_(\d+)_([0-9A-F]{4}-[0-9A-F]{4})\.txt$")
+LEGACY_HASH_RE = re.compile(r"^MAC Hash:\s*([0-9a-f]{64})\s*$", re.MULTILINE)
+# PRAGMA user_version once the legacy import has been considered.
+LEGACY_IMPORTED = 1
+
+COLUMNS = ("mac", "mac_hash", "short_id", "unit_num", "lot", "port", "status", "error", "firmware_hash",
+           "bytes_written", "bytes_skipped", "flash_kbit_s", "registration_status", "label_path",
+           "started_at", "released_at", "finished_at", "fixture_seconds", "duration")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    mac TEXT,
+    mac_hash TEXT,
+    short_id TEXT,
+    unit_num TEXT,
+    lot TEXT,
+    port TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    firmware_hash TEXT,
+    bytes_written INTEGER,
+    bytes_skipped INTEGER,
+    flash_kbit_s REAL,
+    registration_status TEXT,
+    label_path TEXT,
+    started_at REAL,
+    released_at REAL,
+    finished_at REAL,
+    fixture_seconds REAL,
+    duration REAL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_mac_hash ON units (mac_hash);
+CREATE INDEX IF NOT EXISTS units_short_id ON units (short_id);
+CREATE INDEX IF NOT EXISTS units_mac ON units (mac);
+CREATE INDEX IF NOT EXISTS units_lot ON units (lot, unit_num);
+"""
+
+
+LEGACY_COLUMNS = ("mac_hash", "short_id", "unit_num", "lot", "status", "label_path", "finished_at", "recorded_at")
+
+
+def _legacy_rows(label_dir):
+    for name in sorted(os.listdir(label_dir)):
+        match = LEGACY_LABEL_RE.match(name)
+        if not match:
+            continue
+        path = os.path.join(label_dir, name)
+        with open(path) as f:
+            found = LEGACY_HASH_RE.search(f.read())
+        if not found:
+            continue
+        mtime = os.path.getmtime(path)
+        image = path[:-len(".txt")] + ".png"
+        yield (found.group(1), match.group(2), match.group(1), time.strftime("%Y%m%d", time.localtime(mtime)),
+               "passed", image if os.path.exists(image) else None, mtime, mtime)
+
+
+class ProductionDB:
+    """One row per unit attempt (passed or failed), newest last.
+
+    Lookups go through the indexes, so "was this MAC provisioned?" stays a
+    B-tree probe however many units the line has made.
+    """
+
+    def __init__(self, path=PRODUCTION_DB, legacy_label_dir=LEGACY_LABEL_DIR):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._db() as db:
+            db.executescript(SCHEMA)
+        self.imported = self._import_legacy(legacy_label_dir) if legacy_label_dir else 0
+
+    def _import_legacy(self, label_dir):
+        """Once per database: if it has no units yet, add one passed row per legacy label TXT.
+
+        Those files carry the MAC hash and short ID (the MAC itself was never
+        written); the unit number comes from the file name, the lot from its date.
+        Returns the number of rows imported.
+        """
+        with self._db() as db:
+            # Taken before reading, so two stations opening a new DB import once.
+            db.execute("BEGIN IMMEDIATE")
+            if db.execute("PRAGMA user_version").fetchone()[0] >= LEGACY_IMPORTED:
+                return 0
+            rows = []
+            if not db.execute("SELECT 1 FROM units LIMIT 1").fetchone() and os.path.isdir(label_dir):
+                rows = list(_legacy_rows(label_dir))
+            db.executemany(f"INSERT INTO units ({', '.join(LEGACY_COLUMNS)}) "
+                           f"VALUES ({', '.join('?' * len(LEGACY_COLUMNS))})", rows)
+            db.execute(f"PRAGMA user_version = {LEGACY_IMPORTED}")
+        return len(rows)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @contextmanager
+    def _db(self):
+        db = self._connect()
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def record(self, result, **extra):
+        """Store a workflow result dict (plus any `extra` columns). Returns the row id."""
+        row = {"mac": result.get("mac_address"), "mac_hash": result.get("device_id")}
+        row.update({column: result.get(column) for column in COLUMNS if column in result})
+        row.update(extra)
+        columns = [c for c in COLUMNS if c in row] + ["recorded_at"]
+        values = [row[c] for c in columns[:-1]] + [time.time()]
+        with self._db() as db:
+            cursor = db.execute(f"INSERT INTO units ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                values)
+            return cursor.lastrowid
+
+    def _find(self, column, value):
+        with self._db() as db:
+            return [dict(r) for r in db.execute(f"SELECT * FROM units WHERE {column} = ? ORDER BY id", (value,))]
+
+    def find_by_mac(self, mac):
+        return self._find("mac", mac)
+
+    def find_by_mac_hash(self, mac_hash):
+        return self._find("mac_hash", mac_hash)
+
+    def find_by_short_id(self, short_id):
+        return self._find("short_id", short_id)
+
+    def lot(self, lot):
+        with self._db() as db:
+            return [dict(r) for r in db.execute("SELECT * FROM units WHERE lot = ? ORDER BY CAST(unit_num AS INTEGER), id", (lot,))]
+
+    def count(self, status=None):
+        with self._db() as db:
+            if status:
+                return db.execute("SELECT COUNT(*) FROM units WHERE status = ?", (status,)).fetchone()[0]
+            return db.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+
+    def iter_units(self, columns=("mac", "mac_hash", "short_id"), status=None):
+        """Stream rows as tuples of `columns`, without loading the table into memory."""
+        query = f"SELECT {', '.join(columns)} FROM units"
+        params = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        db = self._connect()
+        try:
+            cursor = db.execute(query + " ORDER BY id", params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH)
+                if not rows:
+                    break
+                for row in rows:
+                    yield tuple(row)
+        finally:
+            db.close()
+
+    def set_registration(self, statuses):
+        """statuses: [(mac_hash, registration status)]. Returns the number of rows updated."""
+        with self._db() as db:
+            cursor = db.executemany("UPDATE units SET registration_status = ? WHERE mac_hash = ?",
+                                    [(status, mac_hash) for mac_hash, status in statuses])
+            return cursor.rowcount
+
+    def sync_registration(self, outbox_path):
+        """Copy each unit's registration status over from the outbox journal."""
+        if not os.path.exists(outbox_path):
+            return 0
+        with self._db() as db:
+            db.execute("ATTACH DATABASE ? AS outbox_db", (outbox_path,))
+            cursor = db.execute(
+                "UPDATE units SET registration_status = "
+                "(SELECT status FROM outbox_db.outbox WHERE outbox_db.outbox.mac_hash = units.mac_hash "
+                " ORDER BY id DESC LIMIT 1) "
+                "WHERE mac_hash IS NOT NULL AND mac_hash IN (SELECT mac_hash FROM outbox_db.outbox)")
+            changed = cursor.rowcount
+        return changed
+
+    def export(self, path, lot=None):
+        """Write units (optionally one lot) to `path`: .jsonl as JSON lines, anything else as CSV.
+
+        Returns the number of rows written.
+        """
+        columns = ("id",) + COLUMNS + ("recorded_at",)
+        query = f"SELECT {', '.join(columns)} FROM units"
+        params = ()
+        if lot:
+            query += " WHERE lot = ?"
+            params = (lot,)
+        written = 0
+        db = self._connect()
+        try:
+            cursor = db.execute(query + " ORDER BY id", params)
+            with open(path, "w", newline="") as f:
+                if path.endswith(".jsonl"):
+                    def write(row):
+                        f.write(json.dumps(dict(zip(columns, row))) + "\n")
+                else:
+                    writer = csv.writer(f)
+                    writer.writerow(columns)
+                    write = writer.writerow
+                while True:
+                    rows = cursor.fetchmany(EXPORT_BATCH)
+                    if not rows:
+                        break
+                    for row in rows:
+                        write(tuple(row))
+                    written += len(rows)
+        finally:
+            db.close()
+        return written
@@ -0,0 +1,407 @@
+#
+# provisioning.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.6.4
+#
+# v1.2.0 - Split the flash -> MAC -> hash -> register -> label sequence out of
+#          FactoryProvisioningApp so it can run per port without any widgets
+# v1.2.1 - Flash images come from the shared artifact cache
+# v1.2.2 - Single compressed write_flash of the pre-merged image
+# v1.2.3 - Optional differential flash for reworked units; bytes written/skipped per unit
+# v1.3.0 - Flash and MAC read share one in-process DeviceSession, no esptool subprocesses
+# v1.3.1 - Baud negotiated per fixture instead of a fixed 460800
+# v1.3.2 - Pre-registration goes through the shared pooled RegistrationClient
+# v1.3.3 - Pre-registration is journaled to the outbox and submitted in the background
+# v1.4.0 - Split into a fixture stage (flash + MAC) and a background stage (hash,
+#          register, label) so the fixture is released as soon as the MAC is read
+# v1.4.1 - Live flash progress (percent, kbit/s) to the log and to on_progress
+# v1.4.2 - Labels drawn by a shared LabelRenderer (cached font, fixed QR version/mask)
+# v1.4.3 - batch_labels: no per-unit PNG/TXT or print job; the lot goes out as sheets
+# v1.4.4 - Labels go through a LabelBackend: PIL/PNG + lp as before, or native ZPL
+# v1.4.5 - Unit numbers from a flock'd, atomically replaced counter with block reservation
+# v1.4.6 - Every finished unit is recorded in the production DB (replaces the label TXT files)
+# v1.4.7 - Repeat MACs and short-ID collisions are refused before flashing
+# v1.4.8 - No imaging imports at load time (headless runs never touch PIL/qrcode)
+# v1.4.9 - Pluggable device session; PIANOGUARD_DEVICE=sim runs on simulated boards
+# v1.5.0 - Timing spans per step and per stage (trace ID, port, MAC, outcome) via metrics.tracer
+# v1.5.1 - Backend URL can be overridden with PIANOGUARD_API_URL (staging, bench.py stand-in)
+# v1.6.0 - Verify step: on-chip MD5 of every flashed region against the digests stored with the image
+# v1.6.1 - ZPL jobs that cannot be sent are kept in labels/ for reprint instead of failing the unit
+# v1.6.2 - Registration status in the production DB follows the outbox; lot taken per unit
+# v1.6.3 - set_background_log(): where the shared registration client and outbox log
+# v1.6.4 - One write per merged image; NVS and phy_init between them are left as they are
+#
+
+import subprocess
+import hashlib
+import threading
+import time
+import os
+import uuid
+
+from artifact_cache import ArtifactCache
+from flash_image import firmware_key, merged_images
+from flash_verify import image_regions, verify_regions
+from device_session import DeviceSession
+from flash_progress import format_progress
+from label_backends import PngLabelBackend, ZplLabelBackend, make_sink
+from unit_counter import UnitCounter
+from registration import RegistrationClient
+from outbox import RegistrationOutbox, PENDING
+from production_db import ProductionDB
+from unit_index import UnitIndex, DuplicateUnitError, mac_hash_for, short_id_for
+from metrics import tracer
+
+API_SERVER_URL = os.environ.get("PIANOGUARD_API_URL", "https://45.56.69.50")
+FACTORY_API_KEY = os.environ.get("PIANOGUARD_FACTORY_KEY", "your_super_secret_factory_key")
+DEFAULT_PORT = "/dev/cu.usbmodem101"
+LABEL_DIR = "labels"
+COUNTER_FILE = os.path.join(LABEL_DIR, "unit_counter.txt")
+# Numbers each process reserves per trip to the counter file. 1 keeps a
+# single station's numbers gap-free; raise it when several stations share
+# the file.
+UNIT_BLOCK_SIZE = int(os.environ.get("PIANOGUARD_UNIT_BLOCK", "1"))
+# "png" (PIL image + lp) or "zpl"; ZPL goes to PIANOGUARD_LABEL_PRINTER, which
+# is a directory, "spool:<dir>" or "tcp://host:9100".
+LABEL_BACKEND = os.environ.get("PIANOGUARD_LABEL_BACKEND", "png")
+LABEL_PRINTER = os.environ.get("PIANOGUARD_LABEL_PRINTER", LABEL_DIR)
+BUILD_ARTIFACTS = {
+    "bootloader": "build/bootloader/bootloader.bin",
+    "partition_table": "build/partition_table/partition-table.bin",
+    "app": "build/firmware.bin",
+}
+FLASH_OFFSETS = {"bootloader": 0x0, "partition_table": 0x8000, "app": 0x10000}
+# None lets DeviceSession probe the fastest stable rate for each fixture.
+FLASH_BAUD = None
+# "esptool" (real boards) or "sim" (sim_device, configured by PIANOGUARD_SIM).
+DEVICE_BACKEND = os.environ.get("PIANOGUARD_DEVICE", "esptool")
+
+# One cache per process so every port and every unit reuses the same build.
+artifact_cache = ArtifactCache(artifacts=BUILD_ARTIFACTS)
+# Likewise one keep-alive connection pool to the backend for every port.
+registration_client = RegistrationClient(API_SERVER_URL, FACTORY_API_KEY, verify=False)
+unit_counter = UnitCounter(COUNTER_FILE, block_size=UNIT_BLOCK_SIZE)
+_registration_outbox = None
+_outbox_lock = threading.Lock()
+# Log of the shared client and outbox, which belong to no single unit.
+_background_log = print
+_production_db = None
+_production_db_lock = threading.Lock()
+_unit_index = None
+_unit_index_lock = threading.Lock()
+
+FAILED = "failed"
+# Fixture stage done, background stage still to run.
+FLASHED = "flashed"
+PASSED = "passed"
+
+
+def current_lot():
+    """Production lot recorded with a unit: PIANOGUARD_LOT, else today's date."""
+    return os.environ.get("PIANOGUARD_LOT") or time.strftime("%Y%m%d")
+
+
+def default_session_factory():
+    if DEVICE_BACKEND == "sim":
+        from sim_device import SimulatedDeviceSession
+        return SimulatedDeviceSession
+    return DeviceSession
+
+
+def default_label_backend():
+    if LABEL_BACKEND == "zpl":
+        return ZplLabelBackend(make_sink(LABEL_PRINTER), fallback_dir=LABEL_DIR)
+    return PngLabelBackend(LABEL_DIR)
+
+
+def get_production_db():
+    """The process-wide production database, created on first use."""
+    global _production_db
+    with _production_db_lock:
+        if _production_db is None:
+            _production_db = ProductionDB()
+        return _production_db
+
+
+def get_unit_index(log=print):
+    """The process-wide duplicate index, loaded from the production DB on first use."""
+    global _unit_index
+    with _unit_index_lock:
+        if _unit_index is None:
+            started = time.time()
+            units = get_production_db().iter_units(("mac_hash", "short_id"), status=PASSED)
+            _unit_index = UnitIndex().load(units)
+            log(f"INFO: Loaded {len(_unit_index)} provisioned unit(s) in {time.time() - started:.2f} s.")
+        return _unit_index
+
+
+def set_background_log(log):
+    """Send the shared registration client's and outbox's messages to `log` instead of stdout."""
+    global _background_log
+    _background_log = log
+    registration_client.log = log
+    with _outbox_lock:
+        if _registration_outbox is not None:
+            _registration_outbox.log = log
+
+
+def get_registration_outbox():
+    """The process-wide outbox, opened (and its flusher started) on first use."""
+    global _registration_outbox
+    with _outbox_lock:
+        if _registration_outbox is None:
+            # Registered / rejected is copied onto the unit's row as the backend answers.
+            _registration_outbox = RegistrationOutbox(
+                registration_client, log=_background_log,
+                on_settled=lambda settled: get_production_db().set_registration(settled))
+            _registration_outbox.start()
+        return _registration_outbox
+
+
+class ProvisioningWorkflow:
+    """Runs the five provisioning steps for one device on one port.
+
+    `log` receives every progress line; the GUI passes a widget writer, the
+    station passes a per-port queue writer. `on_progress` receives the
+    structured flash progress events (see flash_progress.FlashProgress).
+
+    With `batch_labels` each unit still gets its number and label image, but
+    nothing is written or printed per unit; label_sheets.print_lot() prints
+    the whole lot afterwards. `label_backend` defaults to the one chosen by
+    PIANOGUARD_LABEL_BACKEND.
+
+    A MAC that was already provisioned is refused before anything is
+    flashed, unless `diff_flash` is on (rework is expected to see repeats).
+
+    Only steps 1-2 need the board on the fixture. run_fixture_stage() does
+    those and releases the port; run_background_stage() finishes the unit
+    from its MAC alone and may run on another thread. run() does both.
+
+    Each step, and each stage as a whole, is a metrics.tracer span tagged
+    with the unit's trace_id, port and MAC.
+    """
+
+    STEPS = ("connect", "flash", "verify", "mac", "hash", "register", "label")
+
+    def __init__(self, log=print, on_step=None, diff_flash=False, on_progress=None, batch_labels=False,
+                 label_backend=None, session_factory=None):
+        self.log = log
+        self.on_step = on_step
+        self.diff_flash = diff_flash
+        self.batch_labels = batch_labels
+        self.label_backend = label_backend or default_label_backend()
+        # Anything with DeviceSession's interface, e.g. sim_device.SimulatedDeviceSession.
+        self.session_factory = session_factory or default_session_factory()
+        self.on_progress = on_progress
+        self._last_progress = None
+        self._span = None
+        os.makedirs(LABEL_DIR, exist_ok=True)
+
+    def _trace(self, name, result):
+        return tracer.start(name, trace_id=result["trace_id"], port=result["port"], mac=result.get("mac_address"))
+
+    def _step(self, name, result):
+        # A step's span runs until the next step starts or the stage ends.
+        self._end_step(result)
+        self._span = self._trace(name, result)
+        if self.on_step:
+            self.on_step(name)
+
+    def _end_step(self, result, outcome="ok"):
+        if self._span:
+            self._span.end(outcome, mac=result.get("mac_address"),
+                           error=result["error"] if outcome != "ok" else None)
+            self._span = None
+
+    def _flash_progress(self, event):
+        # Log every 10 %; the callback gets every (throttled) event.
+        last = self._last_progress
+        self._last_progress = event
+        if last is None or event["percent"] // 10 != last["percent"] // 10:
+            self.log(f"INFO: Flashing {format_progress(event)}")
+        if self.on_progress:
+            self.on_progress(event)
+
+    def run(self, port):
+        result = self.run_fixture_stage(port)
+        if result["status"] == FLASHED:
+            self.run_background_stage(result)
+        return result
+
+    def _fail(self, result, error):
+        result["status"] = FAILED
+        result["error"] = str(error)
+        self.log(f"\n---!!!-!!!---\nERROR: {error}\n---!!!-!!!---")
+
+    def _finish(self, result):
+        result["finished_at"] = time.time()
+        result["duration"] = result["finished_at"] - result["started_at"]
+
+    def _record(self, result):
+        # A unit that made it through is not failed over a bookkeeping error.
+        try:
+            db = get_production_db()
+            db.record(result, lot=current_lot())
+            # Read after the insert: a record the flusher settled before the
+            # row existed is caught here, later ones by on_settled.
+            if result.get("device_id"):
+                db.set_registration([(result["device_id"], get_registration_outbox().status(result["device_id"]))])
+        except Exception as e:
+            self.log(f"WARNING: Could not record unit in the production DB: {e}")
+
+    def run_fixture_stage(self, port):
+        result = {"port": port, "status": FAILED, "error": None, "started_at": time.time(),
+                  "trace_id": uuid.uuid4().hex[:16]}
+        stage = self._trace("fixture_stage", result)
+        try:
+            self._step("connect", result)
+            with self.session_factory(port, FLASH_BAUD, log=self.log, on_progress=self._flash_progress) as session:
+                # Known from the sync already; recorded even if the unit is refused.
+                result["mac_address"] = session.read_mac()
+                result["reworked"] = self.check_unit(result["mac_address"])
+
+                self._step("flash", result)
+                self.log(">>> [STEP 1/5] Flashing Firmware...")
+                result.update(self.flash_firmware(session))
+                self.log(f"SUCCESS: Firmware flash complete ({result['bytes_written']} bytes written, "
+                         f"{result['bytes_skipped']} skipped).")
+
+                self._step("verify", result)
+                self.log("\n>>> Verifying flashed regions...")
+                result["verified_regions"] = self.verify_flash(session, result["image_paths"])
+
+                self._step("mac", result)
+                self.log("\n>>> [STEP 2/5] Reading MAC Address...")
+                result["mac_address"] = self.get_mac_address(session)
+            self._end_step(result)
+            result["status"] = FLASHED
+            if not result["reworked"]:
+                get_unit_index().claim(mac_hash_for(result["mac_address"]))
+            self.log("INFO: Fixture released, the unit can be unplugged.")
+        except Exception as e:
+            self._fail(result, e)
+            self._end_step(result, "error")
+            self._finish(result)
+        result["released_at"] = time.time()
+        result["fixture_seconds"] = result["released_at"] - result["started_at"]
+        stage.end(result["status"], mac=result.get("mac_address"), error=result["error"])
+        if result["status"] == FAILED:
+            self._record(result)
+        return result
+
+    def run_background_stage(self, result):
+        stage = self._trace("background_stage", result)
+        try:
+            self._step("hash", result)
+            self.log(f"\n>>> [STEP 3/5] Hashing Device ID from MAC ({result['mac_address']})...")
+            result["device_id"] = self.hash_id(result["mac_address"])
+
+            self._step("register", result)
+            self.log(f"\n>>> [STEP 4/5] Pre-registering Device in Database...")
+            if not self.pre_register_device_in_db(result["device_id"]):
+                raise RuntimeError("Could not pre-register device. Aborting.")
+
+            self._step("label", result)
+            self.log(f"\n>>> [STEP 5/5] Generating Label Info...")
+            result.update(self.generate_label_info(result["device_id"]))
+            self._end_step(result)
+            result["status"] = PASSED
+        except Exception as e:
+            self._fail(result, e)
+            self._end_step(result, "error")
+            if not result.get("reworked"):
+                # Not provisioned after all; let it be run again.
+                get_unit_index().release(mac_hash_for(result["mac_address"]))
+        finally:
+            self._finish(result)
+            self._record(result)
+            stage.end(result["status"], unit_num=result.get("unit_num"), error=result["error"])
+        return result
+
+    def get_artifacts(self):
+        def build():
+            with tracer.span("idf_build"):
+                subprocess.run(["idf.py", "build"], check=True)
+
+        artifacts = artifact_cache.ensure(build, log=self.log)
+        if "app" not in artifacts:
+            raise RuntimeError("Firmware binary not found. Build it first.")
+        return artifacts
+
+    def flash_firmware(self, session):
+        artifacts = self.get_artifacts()
+        images = merged_images(artifacts, FLASH_OFFSETS, log=self.log)
+        self._last_progress = None
+        stats = {"bytes_written": 0, "bytes_skipped": 0}
+        for offset, image in images:
+            if self.diff_flash:
+                written = session.diff_flash(image, offset)
+                stats["bytes_written"] += written["bytes_written"]
+                stats["bytes_skipped"] += written["bytes_skipped"]
+            else:
+                # The verify step checks every region, so no whole-image MD5 here.
+                stats["bytes_written"] += session.write_flash(image, offset, verify=False)
+        stats["firmware_hash"] = firmware_key(artifacts, FLASH_OFFSETS)
+        stats["image_paths"] = [image for _, image in images]
+        if self._last_progress:
+            stats["flash_kbit_s"] = round(self._last_progress["kbit_s"], 1)
+        return stats
+
+    def verify_flash(self, session, images):
+        """Check each region of `images` on the chip against its stored digest. Returns the region count."""
+        regions = []
+        for image in images:
+            stored = image_regions(image)
+            if not stored:
+                raise RuntimeError(f"No region digests stored for {os.path.basename(image)}.")
+            regions.extend(stored)
+        return verify_regions(session, regions, log=self.log)
+
+    def check_unit(self, mac):
+        """Refuse repeats and short-ID collisions. Returns True for an allowed (rework) repeat."""
+        try:
+            get_unit_index(log=self.log).check(mac)
+        except DuplicateUnitError as e:
+            if not self.diff_flash:
+                raise
+            self.log(f"INFO: {e} Reworking it.")
+            return True
+        return False
+
+    def get_mac_address(self, session):
+        mac = session.read_mac()
+        if not mac:
+            raise RuntimeError("MAC address not found.")
+        self.log(f"SUCCESS: Found MAC Address: {mac}")
+        return mac
+
+    def hash_id(self, input_string):
+        sha256 = hashlib.sha256(input_string.encode("utf-8")).hexdigest()
+        self.log(f"SUCCESS: Hashed to {sha256[:20]}...")
+        return sha256
+
+    def pre_register_device_in_db(self, device_id):
+        # Journaled locally first; the outbox flusher submits it to the backend
+        # in the background, so a slow or down server does not hold the fixture.
+        outbox = get_registration_outbox()
+        key = outbox.enqueue(device_id)
+        self.log(f"SUCCESS: Queued for registration as {key[:24]}... "
+                 f"({outbox.counts()[PENDING]} pending)")
+        return True
+
+    def get_next_unit_number(self):
+        return f"{unit_counter.next():03}"
+
+    def generate_label_info(self, full_hash):
+        short_id = short_id_for(full_hash)
+        unit_num = self.get_next_unit_number()
+        if self.batch_labels:
+            self.log(f"SUCCESS: Label {unit_num} {short_id} held for the lot sheet.")
+            return {"short_id": short_id, "unit_num": unit_num, "label_path": None, "label_image": None}
+
+        label = self.label_backend.emit(full_hash, short_id, unit_num, log=self.log)
+        self.log("SUCCESS: Label info generated and saved.")
+        return {"short_id": short_id, "unit_num": unit_num, **label}
@@ -0,0 +1,139 @@
+#
+# registration.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.3
+#
+# v1.0.0 - Shared keep-alive HTTP client for factory registration: one pooled
+#          requests.Session per backend, bounded retries with jittered backoff
+#          on 5xx / timeouts, and per-request latency metrics.
+# v1.0.1 - Per-request headers (idempotency keys for the outbox)
+# v1.0.2 - Every attempt is a metrics.tracer span (path, status, attempt)
+# v1.0.3 - verify passed on every request (REQUESTS_CA_BUNDLE no longer overrides it);
+#          LatencyStats.describe() for the station / CLI summaries
+#
+
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import tracer
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+LATENCY_WINDOW = 1000
+
+
+class LatencyStats:
+    """Rolling per-request latency record (seconds), safe to share between ports."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+
+    def record(self, seconds, ok):
+        with self._lock:
+            self._samples.append(seconds)
+            self.requests += 1
+            if not ok:
+                self.failures += 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def percentile(self, pct):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+    def summary(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+            "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+        }
+
+    def describe(self):
+        summary = self.summary()
+        if not summary["requests"]:
+            return "no backend requests"
+        return (f"{summary['requests']} backend request(s), {summary['failures']} failed, "
+                f"{summary['retries']} retried, p50 {summary['p50_ms']} ms / p95 {summary['p95_ms']} ms")
+
+
+class RegistrationClient:
+    """POSTs to the factory backend over a persistent, pooled session.
+
+    Timeouts, connection errors and 5xx responses are retried up to `retries`
+    times with exponential backoff and full jitter; 4xx responses are returned
+    to the caller straight away.
+    """
+
+    def __init__(self, base_url, api_key=None, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 verify=True, pool_size=16, log=print):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.log = log
+        self.stats = LatencyStats()
+        # Passed on each request: a session-level verify loses to REQUESTS_CA_BUNDLE / CURL_CA_BUNDLE.
+        self.verify = verify
+        self.session = requests.Session()
+        self.session.headers["Content-Type"] = "application/json"
+        if api_key:
+            self.session.headers["x-factory-api-key"] = api_key
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def post(self, path, payload, log=None, headers=None):
+        log = log or self.log
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            span = tracer.start("http_post", path=path, attempt=attempt + 1)
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, headers=headers,
+                                             verify=self.verify)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                span.end("error", error=type(e).__name__)
+                self.stats.record(time.monotonic() - start, ok=False)
+                error = e
+                log(f"WARNING: POST {path} failed after {(time.monotonic() - start) * 1000:.0f} ms: {e}")
+            else:
+                elapsed = time.monotonic() - start
+                span.end("ok" if response.status_code < 500 else "error", status=response.status_code)
+                self.stats.record(elapsed, ok=response.status_code < 500)
+                log(f"INFO: POST {path} -> {response.status_code} in {elapsed * 1000:.0f} ms")
+                if response.status_code < 500:
+                    return response
+                error = requests.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+            if attempt == self.retries:
+                raise error
+            self.stats.record_retry()
+            delay = self._backoff(attempt)
+            log(f"INFO: Retrying in {delay:.1f} s ({attempt + 1}/{self.retries})...")
+            time.sleep(delay)
+
+    def close(self):
+        self.session.close()
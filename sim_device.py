@@ -0,0 +1,250 @@
+#
+# sim_device.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.5
+#
+# v1.0.0 - Simulated ESP32-S3 behind the DeviceSession interface, for load
+#          tests and benchmarks without hardware: configurable MAC, flash
+#          rate, connect latency and injected sync / link / verify errors.
+# v1.0.1 - flash_md5() and write_flash(verify=...) like DeviceSession
+# v1.0.2 - Images read through image_store, shared by every simulated board
+# v1.0.3 - Flash is per session and sparse (sectors point into the shared image);
+#          only a fixed-MAC board is kept after close, for rework runs
+# v1.0.4 - At most MAX_FALLBACKS lower-rate retries per session, like DeviceSession
+# v1.0.5 - verify() is internal (_verify), as DeviceSession has none
+#
+# Select it with PIANOGUARD_DEVICE=sim (or factory_cli.py run --simulate) and
+# tune it with PIANOGUARD_SIM, e.g. "kbit_s=900,connect_latency=0.3,link_error_rate=0.05".
+#
+
+import hashlib
+import itertools
+import os
+import random
+import threading
+import time
+
+from device_session import MAX_FALLBACKS
+from diff_flash import SECTOR_SIZE
+from flash_progress import FlashProgress
+from image_store import image_store
+
+# Same block size as the esptool stub, so progress arrives at the same pace.
+SIM_BLOCK_SIZE = 0x4000
+SIM_BAUD = 2000000
+SIM_FALLBACK_BAUDS = (2000000, 921600, 460800, 115200)
+# Bytes per second the simulated chip hashes flash at.
+SIM_MD5_RATE = 8 * 1024 * 1024
+
+
+class SimConfig:
+    """Knobs for simulated boards. Rates are probabilities per attempt (0..1)."""
+
+    FIELDS = {"kbit_s": float, "connect_latency": float, "mac": str, "connect_error_rate": float,
+              "link_error_rate": float, "verify_error_rate": float, "seed": int}
+
+    def __init__(self, kbit_s=1500.0, connect_latency=0.5, mac=None, connect_error_rate=0.0,
+                 link_error_rate=0.0, verify_error_rate=0.0, seed=None):
+        self.kbit_s = kbit_s
+        self.connect_latency = connect_latency
+        # Fixed MAC: every connect is the same board (rework runs). None: a new board each time.
+        self.mac = mac
+        self.connect_error_rate = connect_error_rate
+        self.link_error_rate = link_error_rate
+        self.verify_error_rate = verify_error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec):
+        """"key=value,key=value" (see FIELDS); empty gives the defaults."""
+        kwargs = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            key, _, value = item.partition("=")
+            if key not in cls.FIELDS:
+                raise ValueError(f"Unknown simulator setting {key!r}")
+            kwargs[key] = cls.FIELDS[key](value)
+        return cls(**kwargs)
+
+    def chance(self, rate):
+        with self._lock:
+            return rate > 0 and self.random.random() < rate
+
+
+sim_config = SimConfig.parse(os.environ.get("PIANOGUARD_SIM", ""))
+
+# Locally administered MACs with a per-process prefix, so boards from two runs
+# do not collide in the production DB.
+_mac_prefix = random.getrandbits(16)
+_serials = itertools.count(1)
+# Flash of fixed-MAC boards (SimConfig.mac), kept between sessions for rework
+# runs. Every other board is new on each connect and its flash goes with the session.
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def next_mac():
+    serial = next(_serials)
+    octets = (0x02, _mac_prefix >> 8, _mac_prefix & 0xFF, serial >> 16 & 0xFF, serial >> 8 & 0xFF, serial & 0xFF)
+    return ":".join(f"{b:02x}" for b in octets)
+
+
+class SimFlash:
+    """Sparse flash: sector address -> SECTOR_SIZE bytes, erased (0xFF) where absent.
+
+    Whole sectors written from an image keep a view into it instead of a copy,
+    so a simulated board costs next to nothing over the shared image.
+    """
+
+    def __init__(self):
+        self._sectors = {}
+        self._lock = threading.Lock()
+
+    def write(self, address, data):
+        data = memoryview(data)
+        with self._lock:
+            pos = 0
+            while pos < len(data):
+                sector = (address + pos) // SECTOR_SIZE * SECTOR_SIZE
+                start = address + pos - sector
+                size = min(SECTOR_SIZE - start, len(data) - pos)
+                if size == SECTOR_SIZE:
+                    self._sectors[sector] = data[pos:pos + size]
+                else:
+                    current = bytearray(self._sectors.get(sector, b"\xff" * SECTOR_SIZE))
+                    current[start:start + size] = data[pos:pos + size]
+                    self._sectors[sector] = bytes(current)
+                pos += size
+
+    def _pieces(self, address, size):
+        end = address + size
+        sector = address // SECTOR_SIZE * SECTOR_SIZE
+        while sector < end:
+            lo, hi = max(address, sector) - sector, min(end, sector + SECTOR_SIZE) - sector
+            stored = self._sectors.get(sector)
+            yield stored[lo:hi] if stored is not None else b"\xff" * (hi - lo)
+            sector += SECTOR_SIZE
+
+    def read(self, address, size):
+        with self._lock:
+            return b"".join(self._pieces(address, size))
+
+    def md5(self, address, size):
+        digest = hashlib.md5()
+        with self._lock:
+            for piece in self._pieces(address, size):
+                digest.update(piece)
+        return digest.hexdigest()
+
+
+class SimulatedDeviceSession:
+    """Drop-in for device_session.DeviceSession; nothing touches a serial port."""
+
+    def __init__(self, port, baud=None, log=print, cache=None, on_progress=None, config=None):
+        self.port = port
+        self.requested_baud = baud
+        self.baud = None
+        self.log = log
+        self.on_progress = on_progress
+        self.config = config or sim_config
+        self.mac = None
+        self._memory = None
+        self._fallbacks = 0
+
+    def open(self):
+        self.log(f"INFO: Connecting to {self.port} (simulated)...")
+        time.sleep(self.config.connect_latency)
+        if self.config.chance(self.config.connect_error_rate):
+            raise RuntimeError(f"Failed to connect to ESP32-S3: No serial data received. ({self.port}, simulated)")
+        self.mac = self.config.mac or next_mac()
+        if self.config.mac:
+            with _boards_lock:
+                self._memory = _boards.setdefault(self.mac, SimFlash())
+        else:
+            self._memory = SimFlash()
+        self.baud = self.requested_baud or SIM_BAUD
+        self.log(f"INFO: Connected at {self.baud} baud.")
+        return self
+
+    def close(self, reset=True):
+        self._memory = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def read_mac(self):
+        return self.mac
+
+    def _kbit_s(self):
+        # Slower after a simulated fall-back, in proportion to the baud rate.
+        return self.config.kbit_s * self.baud / SIM_BAUD
+
+    def _write(self, address, data, progress):
+        for start in range(0, len(data), SIM_BLOCK_SIZE):
+            block = data[start:start + SIM_BLOCK_SIZE]
+            time.sleep(len(block) * 8 / 1000 / self._kbit_s())
+            if self.config.chance(self.config.link_error_rate):
+                raise OSError(f"Serial data stream stopped at {address + start:#x} (simulated)")
+            self._memory.write(address + start, block)
+            if progress:
+                progress.advance(len(block))
+
+    def _progress(self, total, address):
+        return FlashProgress(total, self.on_progress, address=address) if self.on_progress and total else None
+
+    def _write_with_fallback(self, address, data, progress):
+        done = progress.bytes if progress else 0
+        while True:
+            try:
+                self._write(address, data, progress)
+                return
+            except OSError as e:
+                lower = [b for b in SIM_FALLBACK_BAUDS if b < self.baud] if not self.requested_baud else []
+                if not lower or self._fallbacks >= MAX_FALLBACKS:
+                    raise
+                self._fallbacks += 1
+                self.log(f"WARNING: Link error at {self.baud} baud ({e}), retrying slower...")
+                self.baud = lower[0]
+                if progress:
+                    progress.bytes = done
+
+    def write_flash(self, image_path, offset, verify=True):
+        image = image_store.get(image_path).padded(4)
+        self._write_with_fallback(offset, image, self._progress(len(image), offset))
+        if verify and not self._verify(image, offset):
+            raise RuntimeError("MD5 of image does not match data in flash!")
+        return len(image)
+
+    def diff_flash(self, image_path, offset):
+        image = image_store.get(image_path).padded(SECTOR_SIZE)
+        ranges = [(start, SECTOR_SIZE) for start in range(0, len(image), SECTOR_SIZE)
+                  if self._memory.read(offset + start, SECTOR_SIZE) != image[start:start + SECTOR_SIZE]]
+        written = len(ranges) * SECTOR_SIZE
+        progress = self._progress(written, offset)
+        for start, size in ranges:
+            self._write_with_fallback(offset + start, image[start:start + size], progress)
+        if ranges and not self._verify(image, offset):
+            raise RuntimeError(f"Verify failed at {offset:#x} after diff flash.")
+        self.log(f"INFO: Diff flash wrote {written} bytes in {len(ranges)} range(s), "
+                 f"skipped {len(image) - written} bytes.")
+        return {"bytes_written": written, "bytes_skipped": len(image) - written, "ranges": ranges}
+
+    def flash_md5(self, offset, size):
+        # Roughly the stub's MD5 rate over flash.
+        time.sleep(size / SIM_MD5_RATE)
+        if self.config.chance(self.config.verify_error_rate):
+            stored = bytearray(self._memory.read(offset, size) or b"\0")
+            stored[-1] ^= 0xFF
+            return hashlib.md5(stored).hexdigest()
+        return self._memory.md5(offset, size)
+
+    def _verify(self, image, offset):
+        if self.config.chance(self.config.verify_error_rate):
+            return False
+        return self._memory.md5(offset, len(image)) == hashlib.md5(image).hexdigest()
@@ -0,0 +1,215 @@
+#
+# station.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.3.2
+#
+# v1.2.0 - Multi-port station engine: one provisioning pipeline per fixture,
+#          run concurrently on a worker pool with a shared results store
+# v1.3.0 - Fixture released after flash + MAC; hash/register/label finish on a
+#          background pool with per-unit status
+# v1.3.1 - Flash progress events per port
+# v1.3.2 - Port pool sized for fixtures added later (hot-plug), not just the initial ports
+#
+
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from provisioning import ProvisioningWorkflow, FAILED, FLASHED, PASSED
+
+IDLE = "idle"
+RUNNING = "running"
+# Fixture stage done; the board can come off while the unit finishes in the background.
+RELEASED = "released"
+BACKGROUND_WORKERS = 4
+# Fixtures that can run at once, including ports added after start (hot-plug).
+# Pool threads are only created as ports actually start.
+MAX_FIXTURES = int(os.environ.get("PIANOGUARD_MAX_FIXTURES", "64"))
+
+
+class PortState:
+    """Live state of one fixture. Only the station's worker for that port writes to it."""
+
+    def __init__(self, port):
+        self.port = port
+        self.status = IDLE
+        self.step = None
+        self.mac_address = None
+        self.short_id = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.units_done = 0
+
+    def snapshot(self):
+        return dict(vars(self))
+
+
+class ResultsStore:
+    """Thread-safe unit results from every port.
+
+    Units are tracked from release until their background stage finishes
+    (`in_flight`); finished units move to `results`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = []
+        self._in_flight = {}
+        self._ids = itertools.count(1)
+
+    def track(self, result):
+        with self._lock:
+            result["unit_id"] = next(self._ids)
+            self._in_flight[result["unit_id"]] = result
+        return result["unit_id"]
+
+    def update(self, unit_id, **fields):
+        with self._lock:
+            if unit_id in self._in_flight:
+                self._in_flight[unit_id].update(fields)
+
+    def add(self, result):
+        with self._lock:
+            self._in_flight.pop(result.get("unit_id"), None)
+            self._results.append(result)
+
+    def results(self):
+        with self._lock:
+            return list(self._results)
+
+    def in_flight(self):
+        with self._lock:
+            return [dict(r) for r in self._in_flight.values()]
+
+    def summary(self):
+        results = self.results()
+        passed = [r for r in results if r["status"] == PASSED]
+        summary = {"total": len(results), "passed": len(passed), "failed": len(results) - len(passed),
+                   "in_flight": len(self.in_flight()), "units_per_hour": 0.0}
+        if passed:
+            elapsed = max(r["finished_at"] for r in passed) - min(r["started_at"] for r in results)
+            if elapsed > 0:
+                summary["units_per_hour"] = len(passed) * 3600 / elapsed
+        return summary
+
+
+class ProvisioningStation:
+    """Drives an independent ProvisioningWorkflow on each port in parallel.
+
+    Each port worker only runs the fixture stage (flash + MAC), then hands the
+    unit to a shared background pool and frees the port for the next board.
+
+    Workers never touch Tk. Everything they report goes onto `events` as
+    ("log", port, line), ("state", port, snapshot), ("progress", port,
+    flash progress event) or ("unit", port, result) tuples for the UI (or a
+    console) to drain on its own thread.
+    """
+
+    def __init__(self, ports, results=None, workflow_factory=ProvisioningWorkflow, max_workers=None,
+                 background_workers=BACKGROUND_WORKERS):
+        self.ports = list(dict.fromkeys(p for p in ports if p))
+        self.results = results if results is not None else ResultsStore()
+        self.workflow_factory = workflow_factory
+        self.events = queue.Queue()
+        self.states = {port: PortState(port) for port in self.ports}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(len(self.ports), MAX_FIXTURES),
+                                            thread_name_prefix="station")
+        self._background = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix="station-bg")
+        self._futures = {}
+        self._background_futures = []
+        self._background_lock = threading.Lock()
+
+    def add_port(self, port):
+        if port and port not in self.states:
+            self.ports.append(port)
+            self.states[port] = PortState(port)
+
+    def is_busy(self, port):
+        future = self._futures.get(port)
+        return future is not None and not future.done()
+
+    def start(self, ports=None):
+        """Start a unit on every idle port (or just `ports`). Busy fixtures are skipped."""
+        started = []
+        for port in ports or self.ports:
+            self.add_port(port)
+            if self.is_busy(port):
+                continue
+            self._futures[port] = self._executor.submit(self._run_port, port)
+            started.append(port)
+        return started
+
+    def wait(self):
+        """Block until every started unit has finished both stages."""
+        for future in list(self._futures.values()):
+            future.result()
+        with self._background_lock:
+            pending = list(self._background_futures)
+        for future in pending:
+            future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self._background.shutdown(wait=wait)
+
+    def _publish_state(self, state):
+        self.events.put(("state", state.port, state.snapshot()))
+
+    def _run_port(self, port):
+        state = self.states[port]
+        state.status, state.step, state.error = RUNNING, None, None
+        state.mac_address = state.short_id = None
+        state.started_at, state.finished_at = time.time(), None
+        self._publish_state(state)
+
+        def log(message):
+            self.events.put(("log", port, message))
+
+        def on_step(step):
+            state.step = step
+            self._publish_state(state)
+
+        def on_progress(event):
+            self.events.put(("progress", port, event))
+
+        workflow = self.workflow_factory(log=log, on_step=on_step, on_progress=on_progress)
+        result = workflow.run_fixture_stage(port)
+        self.results.track(result)
+
+        state.status = RELEASED if result["status"] == FLASHED else FAILED
+        state.mac_address = result.get("mac_address")
+        state.error = result.get("error")
+        state.finished_at = result["released_at"]
+        state.units_done += 1
+
+        if result["status"] == FLASHED:
+            future = self._background.submit(self._finish_unit, workflow, result)
+            with self._background_lock:
+                self._background_futures = [f for f in self._background_futures if not f.done()]
+                self._background_futures.append(future)
+        else:
+            self.results.add(result)
+            self.events.put(("unit", port, dict(result)))
+        self._publish_state(state)
+        return result
+
+    def _finish_unit(self, workflow, result):
+        port, unit_id = result["port"], result["unit_id"]
+        tag = result["mac_address"]
+        # The port may already be flashing the next board: log under the
+        # unit's MAC and track steps on the unit, not on the port state.
+        workflow.log = lambda message: self.events.put(("log", port, f"[{tag}] {message}"))
+        workflow.on_step = lambda step: self.results.update(unit_id, step=step)
+        workflow.run_background_stage(result)
+        # PIL images stay out of the store; it only keeps plain data.
+        result.pop("label_image", None)
+        self.results.add(result)
+        self.events.put(("unit", port, dict(result)))
+        return result
@@ -0,0 +1,42 @@
+#
+# conftest.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - The modules live at the repo root; tests never reach the real backend.
+# v1.0.1 - Every test runs in its own directory: .factory_state, labels/ and the
+#          tracer's spans / metrics files never touch the checkout's
+#
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# provisioning reads these at import.
+os.environ.setdefault("PIANOGUARD_API_URL", "http://127.0.0.1:9")
+os.environ.setdefault("PIANOGUARD_LABEL_BACKEND", "png")
+
+from device_session import baud_cache  # noqa: E402
+from metrics import tracer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Run in tmp_path. State paths are relative to the working directory,
+    except the ones the process-wide tracer and baud cache already resolved."""
+    monkeypatch.chdir(tmp_path)
+    state = tmp_path / ".factory_state"
+    monkeypatch.setattr(tracer, "spans_path", str(state / "spans.jsonl"))
+    monkeypatch.setattr(tracer, "metrics_path", str(state / "metrics.prom"))
+    monkeypatch.setattr(tracer, "_file", None)
+    monkeypatch.setattr(tracer, "_histograms", {})
+    monkeypatch.setattr(baud_cache, "path", str(state / "baud_rates.json"))
+    monkeypatch.setattr(baud_cache, "_rates", None)
+    yield tmp_path
+    if tracer._file:
+        tracer._file.close()
@@ -0,0 +1,73 @@
+#
+# test_device_session.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Which esptool errors trigger a baud fall-back, and how often
+# v1.0.1 - Rewritten file keeps mode 0644
+#
+
+import pytest
+from esptool.util import FatalError
+
+import device_session
+from device_session import MAX_FALLBACKS, DeviceSession, is_link_error
+
+
+@pytest.mark.parametrize("message", [
+    "Serial data stream stopped: Possible serial noise or corruption.",
+    "Invalid head of packet (0x4A): Possible serial noise or corruption.",
+    "Digest mismatch: expected 0A, got 0B",
+    "Failed to write to target RAM (result was 01070000: Bad data checksum)",
+])
+def test_link_errors(message):
+    assert is_link_error(FatalError(message))
+
+
+@pytest.mark.parametrize("error", [
+    FatalError("Failed to write compressed data to flash after seq 3 (result was C400: Failed SPI operation)"),
+    FatalError("MD5 of file does not match data in flash!"),
+    OSError("[Errno 5] Input/output error"),
+])
+def test_unit_errors_are_not_link_errors(error):
+    assert not is_link_error(error)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = DeviceSession("/dev/ttyACM0", log=lambda m: None)
+    session.baud = device_session.BAUD_CANDIDATES[0]
+    monkeypatch.setattr(session, "close", lambda reset=True: None)
+
+    def reopen(candidates):
+        session.baud = candidates[0]
+
+    monkeypatch.setattr(session, "_open_from", reopen)
+    return session
+
+
+def test_unit_error_is_not_retried_slower(session):
+    error = FatalError("Failed to write compressed data to flash (result was C400: Failed SPI operation)")
+    with pytest.raises(FatalError):
+        session._fall_back(error)
+    assert session.baud == device_session.BAUD_CANDIDATES[0]
+
+
+def test_fall_backs_are_capped(session):
+    error = FatalError("Serial data stream stopped: Possible serial noise or corruption.")
+    for step in range(MAX_FALLBACKS):
+        session._fall_back(error)
+        assert session.baud == device_session.BAUD_CANDIDATES[step + 1]
+    with pytest.raises(FatalError):
+        session._fall_back(error)
+
+
+def test_baud_cache_file_stays_readable(tmp_path):
+    path = tmp_path / "baud_rates.json"
+    cache = device_session.BaudCache(str(path))
+    cache.put("usb:1-1.2", 921600)
+    assert path.stat().st_mode & 0o777 == 0o644
+    assert device_session.BaudCache(str(path)).get("usb:1-1.2") == 921600
@@ -0,0 +1,55 @@
+#
+# test_diff_flash.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - changed_ranges() against a fake loader holding flash in memory
+#
+
+import hashlib
+
+from diff_flash import CHUNK_SIZE, SECTOR_SIZE, changed_ranges
+
+OFFSET = 0x10000
+
+
+class FakeLoader:
+    def __init__(self, flash):
+        self.flash = flash
+        self.md5_calls = 0
+
+    def flash_md5sum(self, address, size):
+        self.md5_calls += 1
+        return hashlib.md5(self.flash[address - OFFSET:address - OFFSET + size]).hexdigest()
+
+
+def image_of(sectors):
+    return bytes(i % 251 for i in range(sectors * SECTOR_SIZE))
+
+
+def test_identical_flash_is_one_md5_per_chunk():
+    image = image_of(40)
+    esp = FakeLoader(bytearray(image))
+    assert changed_ranges(esp, image, OFFSET) == []
+    assert esp.md5_calls == -(-len(image) // CHUNK_SIZE)
+
+
+def test_adjacent_changed_sectors_are_merged():
+    image = image_of(40)
+    flash = bytearray(image)
+    for sector in (3, 4, 5, 20):
+        flash[sector * SECTOR_SIZE] ^= 0xFF
+    assert changed_ranges(FakeLoader(flash), image, OFFSET) == [
+        (3 * SECTOR_SIZE, 3 * SECTOR_SIZE), (20 * SECTOR_SIZE, SECTOR_SIZE)]
+
+
+def test_range_spanning_a_chunk_boundary():
+    image = image_of(40)
+    flash = bytearray(image)
+    boundary = CHUNK_SIZE // SECTOR_SIZE
+    flash[(boundary - 1) * SECTOR_SIZE] ^= 0xFF
+    flash[boundary * SECTOR_SIZE] ^= 0xFF
+    assert changed_ranges(FakeLoader(flash), image, OFFSET) == [((boundary - 1) * SECTOR_SIZE, 2 * SECTOR_SIZE)]
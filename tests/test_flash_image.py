@@ -0,0 +1,58 @@
+#
+# test_flash_image.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Merged images leave unwritten sectors (NVS, phy_init) alone
+#
+
+import os
+
+import pytest
+
+from flash_image import merged_images, split_layout
+from flash_verify import image_regions
+
+OFFSETS = {"bootloader": 0x0, "partition_table": 0x8000, "ota_data": 0xf000, "spiffs": 0x12000, "app": 0xa0000}
+NVS = range(0x9000, 0xf000)
+
+
+def write_artifacts(tmp_path, sizes):
+    artifacts = {}
+    for name, size in sizes.items():
+        path = tmp_path / f"{name}.bin"
+        # No partition-table magic, so the default offsets apply.
+        path.write_bytes(b"\x5a" * size)
+        artifacts[name] = str(path)
+    return artifacts
+
+
+def test_split_layout_keeps_partial_sector_gaps_in_one_run():
+    layout = [(0x0, "bootloader"), (0x6000, "partition_table")]
+    assert split_layout(layout, {"bootloader": 0x5100, "partition_table": 0xc00}) == [layout]
+
+
+def test_split_layout_starts_a_run_after_a_free_sector():
+    layout = [(0x8000, "partition_table"), (0xf000, "ota_data"), (0x12000, "spiffs")]
+    runs = split_layout(layout, {"partition_table": 0xc00, "ota_data": 0x2000, "spiffs": 0x1000})
+    assert runs == [[(0x8000, "partition_table")], [(0xf000, "ota_data")], [(0x12000, "spiffs")]]
+
+
+def test_split_layout_refuses_overlaps():
+    with pytest.raises(RuntimeError):
+        split_layout([(0x0, "bootloader"), (0x8000, "partition_table")], {"bootloader": 0x9000, "partition_table": 0xc00})
+
+
+def test_merged_images_never_cover_nvs(tmp_path):
+    artifacts = write_artifacts(tmp_path, {
+        "bootloader": 0x5000, "partition_table": 0xc00, "ota_data": 0x2000, "spiffs": 0x1000, "app": 0x3000,
+    })
+    images = merged_images(artifacts, OFFSETS, log=lambda *_: None)
+    for offset, path in images:
+        end = offset + os.path.getsize(path)
+        assert end <= NVS.start or offset >= NVS.stop
+    regions = [region["name"] for _, path in images for region in image_regions(path)]
+    assert sorted(regions) == sorted(artifacts)
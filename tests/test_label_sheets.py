@@ -0,0 +1,18 @@
+#
+# test_label_sheets.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Sheet order follows the numeric unit number (1000 after 999)
+#
+
+from label_sheets import labels_from_results
+
+
+def test_label_sheets_in_numeric_unit_order():
+    results = [{"status": "passed", "unit_num": num, "short_id": num, "device_id": num}
+               for num in ("1000", "999", "995", "1004")]
+    assert [label[0] for label in labels_from_results(results)] == ["995", "999", "1000", "1004"]
@@ -0,0 +1,101 @@
+#
+# test_outbox.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Outbox record states for each kind of backend answer
+#
+
+import pytest
+import requests
+
+from outbox import BATCH_PATH, PENDING, PROVISION_PATH, REGISTERED, REJECTED, RegistrationOutbox
+
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+class FakeClient:
+    """Answers each path with a Response, or a function of the posted body."""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.posts = []
+
+    def post(self, path, body, log=None, headers=None):
+        self.posts.append(path)
+        answer = self.answers[path]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer(body) if callable(answer) else answer
+
+
+@pytest.fixture
+def make_outbox(tmp_path):
+    def make(answers, **kwargs):
+        return RegistrationOutbox(FakeClient(answers), path=str(tmp_path / "outbox.db"), log=lambda m: None,
+                                  **kwargs)
+    return make
+
+
+def batch_results(statuses):
+    return lambda body: Response(200, {"results": [
+        {"idempotency_key": item["idempotency_key"], "status": statuses[item["mac_hash"]]}
+        for item in body["devices"]]})
+
+
+def test_batch_registers_and_rejects(make_outbox):
+    settled = []
+    outbox = make_outbox({BATCH_PATH: batch_results({"a": "ok", "b": "invalid", "c": "busy"})},
+                         on_settled=settled.extend)
+    for mac_hash in "abc":
+        outbox.enqueue(mac_hash)
+    assert outbox.flush_once() == 3
+    assert (outbox.status("a"), outbox.status("b"), outbox.status("c")) == (REGISTERED, REJECTED, PENDING)
+    assert sorted(settled) == [("a", REGISTERED), ("b", REJECTED)]
+
+
+def test_missing_batch_endpoint_falls_back_to_single_posts(make_outbox):
+    outbox = make_outbox({BATCH_PATH: Response(404), PROVISION_PATH: Response(201)})
+    outbox.enqueue("a")
+    outbox.flush_once()
+    assert outbox.status("a") == REGISTERED
+    assert not outbox.batch_supported
+
+
+@pytest.mark.parametrize("answer", [Response(404), Response(500), Response(401),
+                                    requests.ConnectionError("refused")])
+def test_only_validation_errors_reject(make_outbox, answer):
+    outbox = make_outbox({BATCH_PATH: Response(405), PROVISION_PATH: answer})
+    outbox.enqueue("a")
+    outbox.flush_once()
+    assert outbox.status("a") == PENDING
+
+
+def test_validation_error_rejects_and_requeue_retries(make_outbox):
+    outbox = make_outbox({BATCH_PATH: Response(405), PROVISION_PATH: Response(422)})
+    outbox.enqueue("a")
+    outbox.flush_once()
+    assert outbox.status("a") == REJECTED
+    outbox.enqueue("a")
+    assert outbox.counts() == {PENDING: 1, REGISTERED: 0, REJECTED: 0}
+
+
+def test_registered_record_is_not_requeued(make_outbox):
+    outbox = make_outbox({BATCH_PATH: batch_results({"a": "ok"})})
+    outbox.enqueue("a")
+    outbox.flush_once()
+    outbox.enqueue("a")
+    assert outbox.status("a") == REGISTERED
+    assert outbox.flush_once() == 0
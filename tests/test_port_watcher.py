@@ -0,0 +1,64 @@
+#
+# test_port_watcher.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Arrival dedup: resets are ignored, a failed board retries after a real replug
+#
+
+import pytest
+
+import port_watcher
+from port_watcher import ESP32_S3_USB_JTAG, PortWatcher
+
+DEVICE = "/dev/ttyACM0"
+
+
+class PortInfo:
+    def __init__(self, device, serial_number):
+        self.device = device
+        self.vid, self.pid = ESP32_S3_USB_JTAG
+        self.serial_number = serial_number
+        self.location = None
+        self.description = None
+
+
+@pytest.fixture
+def bench(monkeypatch):
+    """(plugged-in ports, arrivals, watcher) with list_ports replaced."""
+    plugged = []
+    monkeypatch.setattr(port_watcher.list_ports, "comports", lambda: list(plugged))
+    arrivals = []
+    watcher = PortWatcher(lambda port: arrivals.append(port.device), settle=0, log=lambda m: None)
+    return plugged, arrivals, watcher
+
+
+def replug(plugged, watcher, unplugged_at, back_at):
+    plugged.clear()
+    watcher.poll(unplugged_at)
+    plugged.append(PortInfo(DEVICE, "7CDFA1001122"))
+    watcher.poll(back_at)
+
+
+def test_reset_after_flashing_is_not_a_new_board(bench):
+    plugged, arrivals, watcher = bench
+    plugged.append(PortInfo(DEVICE, "7CDFA1001122"))
+    watcher.poll(0)
+    replug(plugged, watcher, 10, 10.3)
+    replug(plugged, watcher, 20, 30)
+    assert arrivals == [DEVICE]
+
+
+def test_failed_board_retries_only_after_a_real_replug(bench):
+    plugged, arrivals, watcher = bench
+    plugged.append(PortInfo(DEVICE, "7CDFA1001122"))
+    watcher.poll(0)
+    watcher.mark_failed(DEVICE)
+    # The session's hard reset re-enumerates the board at once.
+    replug(plugged, watcher, 10, 10.3)
+    assert arrivals == [DEVICE]
+    replug(plugged, watcher, 20, 25)
+    assert arrivals == [DEVICE, DEVICE]
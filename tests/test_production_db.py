@@ -0,0 +1,56 @@
+#
+# test_production_db.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - One-time import of the legacy labels/device_NNN_<ID>.txt records
+#
+
+import pytest
+
+from production_db import ProductionDB
+from unit_index import DuplicateUnitError, UnitIndex, mac_hash_for, short_id_for
+
+MAC = "7c:df:a1:00:11:22"
+
+
+def write_legacy_label(label_dir, unit_num, mac):
+    mac_hash = mac_hash_for(mac)
+    path = label_dir / f"device_{unit_num}_{short_id_for(mac_hash)}.txt"
+    path.write_text(f"MAC Hash: {mac_hash}\nHuman-Readable ID: {short_id_for(mac_hash)}\n")
+
+
+@pytest.fixture
+def label_dir(tmp_path):
+    label_dir = tmp_path / "labels"
+    label_dir.mkdir()
+    (label_dir / "unit_counter.txt").write_text("2")
+    write_legacy_label(label_dir, "001", MAC)
+    write_legacy_label(label_dir, "002", "7c:df:a1:00:11:23")
+    return label_dir
+
+
+def test_new_database_imports_legacy_labels_once(tmp_path, label_dir):
+    db = ProductionDB(str(tmp_path / "production.db"), legacy_label_dir=str(label_dir))
+    assert db.imported == 2
+    row, = db.find_by_mac_hash(mac_hash_for(MAC))
+    assert (row["unit_num"], row["short_id"], row["status"]) == ("001", short_id_for(mac_hash_for(MAC)), "passed")
+    assert ProductionDB(str(tmp_path / "production.db"), legacy_label_dir=str(label_dir)).imported == 0
+    assert db.count() == 2
+
+
+def test_legacy_units_count_as_provisioned(tmp_path, label_dir):
+    db = ProductionDB(str(tmp_path / "production.db"), legacy_label_dir=str(label_dir))
+    index = UnitIndex().load(db.iter_units(("mac_hash", "short_id"), status="passed"))
+    with pytest.raises(DuplicateUnitError):
+        index.check(MAC)
+
+
+def test_database_with_units_is_left_alone(tmp_path, label_dir):
+    db = ProductionDB(str(tmp_path / "production.db"), legacy_label_dir=None)
+    db.record({"mac_address": "02:00:00:00:00:01", "device_id": "ab", "status": "passed"})
+    assert ProductionDB(str(tmp_path / "production.db"), legacy_label_dir=str(label_dir)).imported == 0
+    assert db.count() == 1
@@ -0,0 +1,73 @@
+#
+# test_sim_provisioning.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - One unit through both stages on a simulated board, no hardware or backend
+# v1.0.1 - Scratch directory comes from conftest.isolated_state
+#
+
+import functools
+
+import pytest
+
+import provisioning
+from outbox import PENDING, RegistrationOutbox
+from production_db import ProductionDB
+from sim_device import SimConfig, SimulatedDeviceSession
+
+FAST = dict(kbit_s=1e6, connect_latency=0)
+
+
+class OfflineClient:
+    def post(self, *args, **kwargs):
+        raise AssertionError("the flusher is not started in tests")
+
+
+@pytest.fixture
+def station_dir(tmp_path, monkeypatch):
+    """A build tree in the test's directory and fresh process-wide singletons."""
+    for path, size in (("build/bootloader/bootloader.bin", 0x5000),
+                       ("build/partition_table/partition-table.bin", 0xC00),
+                       ("build/firmware.bin", 0x23456)):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(bytes((i * 7 + size) % 256 for i in range(size)))
+    monkeypatch.setattr(provisioning, "artifact_cache", provisioning.ArtifactCache(
+        artifacts=provisioning.BUILD_ARTIFACTS, log=lambda m: None))
+    monkeypatch.setattr(provisioning, "unit_counter", provisioning.UnitCounter(provisioning.COUNTER_FILE))
+    monkeypatch.setattr(provisioning, "_production_db", ProductionDB())
+    monkeypatch.setattr(provisioning, "_unit_index", None)
+    monkeypatch.setattr(provisioning, "_registration_outbox",
+                        RegistrationOutbox(OfflineClient(), log=lambda m: None))
+    return tmp_path
+
+
+def workflow(**config):
+    session = functools.partial(SimulatedDeviceSession, config=SimConfig(**dict(FAST, **config)))
+    return provisioning.ProvisioningWorkflow(log=lambda m: None, batch_labels=True, session_factory=session)
+
+
+def test_unit_passes_and_is_recorded(station_dir):
+    result = workflow().run("/dev/sim0")
+    assert result["status"] == provisioning.PASSED, result["error"]
+    assert result["unit_num"] == "001"
+    assert result["verified_regions"] == 3
+    rows = provisioning.get_production_db().find_by_mac(result["mac_address"])
+    assert [(r["status"], r["registration_status"]) for r in rows] == [(provisioning.PASSED, PENDING)]
+
+
+def test_repeat_board_is_refused(station_dir):
+    mac = "02:00:00:00:00:01"
+    assert workflow(mac=mac).run("/dev/sim0")["status"] == provisioning.PASSED
+    repeat = workflow(mac=mac).run("/dev/sim0")
+    assert repeat["status"] == provisioning.FAILED
+    assert "already provisioned" in repeat["error"]
+
+
+def test_corrupted_flash_fails_verify(station_dir):
+    result = workflow(verify_error_rate=1.0).run("/dev/sim0")
+    assert result["status"] == provisioning.FAILED
+    assert "Flash verify failed" in result["error"]
@@ -0,0 +1,64 @@
+#
+# test_unit_counter.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Numbers continue from the file, blocks never overlap, threads never share one
+# v1.0.1 - Rewritten file keeps mode 0644
+#
+
+import threading
+
+import pytest
+
+from unit_counter import UnitCounter
+
+
+def test_counter_continues_from_file(tmp_path):
+    path = tmp_path / "unit_counter.txt"
+    path.write_text("41")
+    counter = UnitCounter(str(path))
+    assert [counter.next() for _ in range(3)] == [42, 43, 44]
+    assert path.read_text() == "44"
+
+
+def test_counter_blocks_skip_unused_numbers(tmp_path):
+    path = str(tmp_path / "unit_counter.txt")
+    first, second = UnitCounter(path, block_size=10), UnitCounter(path, block_size=10)
+    assert (first.next(), second.next(), first.next()) == (1, 11, 2)
+    assert UnitCounter(path).next() == 21
+
+
+def test_counter_numbers_are_unique_across_threads(tmp_path):
+    counter = UnitCounter(str(tmp_path / "unit_counter.txt"), block_size=3)
+    numbers = []
+    lock = threading.Lock()
+
+    def take():
+        for _ in range(25):
+            number = counter.next()
+            with lock:
+                numbers.append(number)
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(numbers) == list(range(1, 101))
+
+
+def test_corrupt_counter_is_refused(tmp_path):
+    path = tmp_path / "unit_counter.txt"
+    path.write_text("12x")
+    with pytest.raises(RuntimeError):
+        UnitCounter(str(path)).next()
+
+
+def test_counter_file_stays_readable(tmp_path):
+    path = tmp_path / "unit_counter.txt"
+    UnitCounter(str(path)).next()
+    assert path.stat().st_mode & 0o777 == 0o644
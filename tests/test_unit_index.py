@@ -0,0 +1,34 @@
+#
+# test_unit_index.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - Repeat MACs and short-ID collisions are refused
+#
+
+import pytest
+
+from unit_index import DuplicateUnitError, ShortIdCollisionError, UnitIndex, mac_hash_for, short_id_for
+
+
+def test_index_refuses_repeats_until_released():
+    index = UnitIndex()
+    mac_hash, short_id = index.check("7c:df:a1:00:00:01")
+    index.claim(mac_hash, short_id)
+    with pytest.raises(DuplicateUnitError):
+        index.check("7c:df:a1:00:00:01")
+    index.release(mac_hash, short_id)
+    assert index.check("7c:df:a1:00:00:01") == (mac_hash, short_id)
+
+
+def test_index_refuses_short_id_collisions():
+    taken = mac_hash_for("7c:df:a1:00:00:01")
+    # A different hash that shares the printed short ID.
+    other = taken[:8] + ("0" if taken[8] != "0" else "1") + taken[9:]
+    index = UnitIndex().load([(other, short_id_for(other))])
+    with pytest.raises(ShortIdCollisionError):
+        index.check("7c:df:a1:00:00:01")
+    assert len(index) == 1
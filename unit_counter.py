@@ -0,0 +1,104 @@
+#
+# unit_counter.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.1
+#
+# v1.0.0 - Unit number allocator. The counter file is only touched under an
+#          exclusive flock and replaced by fsync + atomic rename, so parallel
+#          fixtures and several stations sharing the file never hand out the
+#          same number and a crash can't leave it half written.
+# v1.0.1 - The counter keeps 0644 across rewrites (mkstemp files are 0600), so
+#          stations running as other users can still read it
+#
+
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class UnitCounter:
+    """Hands out unit numbers from a plain-text counter file (last number used).
+
+    With `block_size` > 1 each process reserves that many numbers at a time
+    and serves them from memory, so stations only meet on the file lock once
+    per block. Numbers left in a block when the process exits are skipped,
+    never reused.
+    """
+
+    def __init__(self, path, block_size=1):
+        self.path = path
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    @contextmanager
+    def _file_lock(self):
+        # Lock a sidecar file: the counter itself is replaced on every write,
+        # and a lock on a replaced inode protects nothing.
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                text = f.read().strip()
+        except FileNotFoundError:
+            return 0
+        try:
+            return int(text)
+        except ValueError:
+            # Starting over at 1 would duplicate every label already printed.
+            raise RuntimeError(f"Unit counter {self.path} is corrupt: {text!r}")
+
+    def _write(self, value):
+        directory = os.path.dirname(self.path) or "."
+        fd, tmp = tempfile.mkstemp(prefix=".unit_counter-", dir=directory)
+        try:
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w") as f:
+                f.write(str(value))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def reserve(self, count):
+        """Claim `count` consecutive numbers in the file. Returns a range."""
+        with self._file_lock():
+            last = self._read()
+            self._write(last + count)
+        return range(last + 1, last + count + 1)
+
+    def next(self):
+        with self._lock:
+            if self._next >= self._end:
+                block = self.reserve(self.block_size)
+                self._next, self._end = block.start, block.stop
+            number = self._next
+            self._next += 1
+            return number
+
+    def peek(self):
+        """Last number claimed by anyone (not necessarily used yet)."""
+        with self._file_lock():
+            return self._read()
@@ -0,0 +1,90 @@
+#
+# unit_index.py
+#
+# Created on: 2026-10-17
+# Edited on: 2026-10-17
+#     Author: Andwardo
+#     Version: v1.0.0
+#
+# v1.0.0 - In-memory index of provisioned units, loaded once from the
+#          production DB: a set of mac_hashes for re-provisioning checks and a
+#          short_id -> mac_hash map for label ID collisions, both O(1), so a
+#          duplicate is caught before it costs a flash cycle and a label.
+#
+
+import hashlib
+import threading
+
+
+class DuplicateUnitError(RuntimeError):
+    """This MAC has already been provisioned."""
+
+
+class ShortIdCollisionError(RuntimeError):
+    """A different MAC already carries this unit's printed short ID."""
+
+
+def mac_hash_for(mac):
+    return hashlib.sha256(mac.encode("utf-8")).hexdigest()
+
+
+def short_id_for(mac_hash):
+    # Only 32 bits of the hash make it onto the label, which is why collisions
+    # have to be checked at all.
+    return f"{mac_hash[:4].upper()}-{mac_hash[4:8].upper()}"
+
+
+class UnitIndex:
+    """Which MACs are done and which short IDs are taken. Safe to share between ports.
+
+    Units are claimed when their fixture stage succeeds (so a board plugged
+    back in while it is still finishing is caught too) and released again if
+    their background stage fails.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mac_hashes = set()
+        self._short_ids = {}
+
+    def __len__(self):
+        return len(self._mac_hashes)
+
+    def load(self, units):
+        """Add (mac_hash, short_id) pairs, e.g. ProductionDB.iter_units(("mac_hash", "short_id"), "passed")."""
+        with self._lock:
+            for mac_hash, short_id in units:
+                if not mac_hash:
+                    continue
+                self._mac_hashes.add(mac_hash)
+                self._short_ids.setdefault(short_id or short_id_for(mac_hash), mac_hash)
+        return self
+
+    def check(self, mac):
+        """Raise if `mac` is a repeat or its short ID is taken. Returns (mac_hash, short_id)."""
+        mac_hash = mac_hash_for(mac)
+        short_id = short_id_for(mac_hash)
+        with self._lock:
+            if mac_hash in self._mac_hashes:
+                raise DuplicateUnitError(f"{mac} was already provisioned (ID {short_id}).")
+            owner = self._short_ids.get(short_id)
+        if owner is not None and owner != mac_hash:
+            raise ShortIdCollisionError(f"Short ID {short_id} of {mac} is already on another unit "
+                                        f"(hash {owner[:16]}...).")
+        return mac_hash, short_id
+
+    def claim(self, mac_hash, short_id=None):
+        with self._lock:
+            self._mac_hashes.add(mac_hash)
+            self._short_ids.setdefault(short_id or short_id_for(mac_hash), mac_hash)
+
+    def release(self, mac_hash, short_id=None):
+        short_id = short_id or short_id_for(mac_hash)
+        with self._lock:
+            self._mac_hashes.discard(mac_hash)
+            if self._short_ids.get(short_id) == mac_hash:
+                del self._short_ids[short_id]
+
+    def contains(self, mac):
+        with self._lock:
+            return mac_hash_for(mac) in self._mac_hashes